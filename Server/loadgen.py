@@ -0,0 +1,95 @@
+"""
+Publish synthetic readings, e.g. to load test the bridge against a local broker.
+
+Every message carries a per-device sequence number as its temperature, so the
+forwarded readings show whether each device's order was kept. The API only
+stores readings of registered devices, so register loadgen-0 ... loadgen-N
+for a user once with --register.
+
+Usage:
+    python loadgen.py [--devices 100] --register USERNAME [--password PASSWORD]
+    python loadgen.py [--devices 100] [--messages 100000] [--rate 0]
+"""
+import argparse
+import json
+import os
+import time
+
+import paho.mqtt.client as mqtt
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+base_topic = os.environ.get("BASE_TOPIC")
+BROKER = os.environ.get("MQTT_BROKER", "broker.hivemq.com")
+PORT = int(os.environ.get("MQTT_PORT", 1883))
+API_BASE_URL = os.environ.get("API_BASE_URL", "http://localhost:6543")
+
+
+def device_ids(count):
+    return [f"loadgen-{i}" for i in range(count)]
+
+def register(count, username, password):
+    """Log in as username and add the load generator's devices it does not own yet."""
+    session = requests.Session()
+    response = session.post(f"{API_BASE_URL}/login", data={"username": username, "password": password},
+                            allow_redirects=False)
+    if "sessionID" not in session.cookies:
+        raise SystemExit(f"Login as {username} failed: {response.status_code} {response.text[:200]}")
+    response = session.get(f"{API_BASE_URL}/api/devices")
+    response.raise_for_status()
+    owned = {device["device_id"] for device in response.json()["devices"]}
+    missing = [device_id for device_id in device_ids(count) if device_id not in owned]
+    for device_id in missing:
+        response = session.post(f"{API_BASE_URL}/api/devices", json={"deviceId": device_id})
+        if response.status_code != 200:
+            raise SystemExit(f"Could not register {device_id}: {response.status_code} {response.text[:200]}")
+    print(f"Registered {len(missing)} devices for {username}, {count - len(missing)} were already registered")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish synthetic sensor readings")
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--rate", type=float, default=0, help="Messages per second, 0 for as fast as possible")
+    parser.add_argument("--register", metavar="USERNAME", default=None,
+                        help="Register the devices for this user at API_BASE_URL instead of publishing")
+    parser.add_argument("--password", default=os.environ.get("LOADGEN_PASSWORD"))
+    args = parser.parse_args()
+
+    if args.register:
+        register(args.devices, args.register, args.password)
+        return
+
+    if hasattr(mqtt, "CallbackAPIVersion"):
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
+    else:
+        client = mqtt.Client()
+    client.max_queued_messages_set(0)
+    client.connect(BROKER, PORT, keepalive=60)
+    client.loop_start()
+
+    topic = f"{base_topic}/readings"
+    started = time.monotonic()
+    info = None
+    for i in range(args.messages):
+        payload = {
+            "device_id": f"loadgen-{i % args.devices}",
+            "temperature": i // args.devices,
+            "humidity": 50.0,
+            "light": 300.0,
+        }
+        info = client.publish(topic, json.dumps(payload), qos=1)
+        if args.rate:
+            time.sleep(max(0.0, (i + 1) / args.rate - (time.monotonic() - started)))
+    if info is not None:
+        info.wait_for_publish()
+    elapsed = time.monotonic() - started
+    print(f"Published {args.messages} messages from {args.devices} devices in {elapsed:.1f}s "
+          f"({args.messages / elapsed:.0f} messages/s)")
+    client.disconnect()
+    client.loop_stop()
+
+if __name__ == "__main__":
+    main()
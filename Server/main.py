@@ -1,54 +1,160 @@
-import paho.mqtt.client as mqtt
+import asyncio
 import json
-from datetime import datetime
+import multiprocessing
+import os
+import queue
+import random
+import signal
+import sqlite3
+import threading
+import time
+import zlib
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from multiprocessing.connection import wait
+
 import numpy as np
-import os
-from dotenv import load_dotenv
+import paho.mqtt.client as mqtt
 import requests
-import time
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+from spool import Spool
 
 load_dotenv()
 
 # Get BASE_TOPIC from environment variable
 base_topic = os.environ.get("BASE_TOPIC")
 
-
 # MQTT Broker settings
-BROKER = "broker.hivemq.com"
-PORT = 1883
-#BASE_TOPIC = "poop/ece140/sensors"
+BROKER = os.environ.get("MQTT_BROKER", "broker.hivemq.com")
+PORT = int(os.environ.get("MQTT_PORT", 1883))
 TOPIC = base_topic + "/#"
 
-API_URL = "http://localhost:6543/api/temperature"  # Update host if running on different machine
+# Readings are posted in batches to {API_BASE_URL}/api/sensor/batch
+API_BASE_URL = os.environ.get("API_BASE_URL", "http://localhost:6543")  # Update host if running on different machine
+# Device ID for payloads that do not carry their own device_id
+DEVICE_ID = os.environ.get("DEVICE_ID", os.environ.get("CLIENT_ID", "esp32-sensors"))
 
-# Time tracking for rate limiting (5 seconds)
-last_post_time = 0
-POST_INTERVAL = 5  # seconds
+# Payload fields forwarded to the server, with the unit each is reported in
+SENSOR_UNITS = {"temperature": "C", "humidity": "%", "light": "lux"}
 
-#if BASE_TOPIC == "poop/ece140/sensors":
- #   print("readings")
- #   exit()
+# Messages waiting to be forwarded, and how many batch requests are in flight at once
+QUEUE_SIZE = int(os.environ.get("BRIDGE_QUEUE_SIZE", 10000))
+FORWARDERS = int(os.environ.get("BRIDGE_FORWARDERS", 4))
+REQUEST_TIMEOUT = float(os.environ.get("BRIDGE_REQUEST_TIMEOUT", 10))
 
-def post_temperature_to_server(value, unit="C", timestamp=None):
-    """Send temperature data to the FastAPI server via POST request."""
-    if not timestamp:
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+# A batch is sent once it holds BATCH_SIZE readings or BATCH_WINDOW seconds after its first one
+BATCH_SIZE = int(os.environ.get("BRIDGE_BATCH_SIZE", 500))
+BATCH_WINDOW = float(os.environ.get("BRIDGE_BATCH_WINDOW", 0.5))
 
-    payload = {
-        "value": value,
-        "unit": unit,
-        "timestamp": timestamp
-    }
+# Failed requests are retried with exponential backoff and full jitter
+MAX_RETRIES = int(os.environ.get("BRIDGE_MAX_RETRIES", 5))
+RETRY_BASE_DELAY = float(os.environ.get("BRIDGE_RETRY_BASE_DELAY", 0.5))
+RETRY_MAX_DELAY = float(os.environ.get("BRIDGE_RETRY_MAX_DELAY", 30))
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Readings that could not be forwarded are kept in an SQLite spool and replayed
+# in batches of SPOOL_REPLAY_BATCH, at most SPOOL_REPLAY_RATE readings per second
+SPOOL_PATH = os.environ.get("BRIDGE_SPOOL_PATH", "spool/bridge.db")
+SPOOL_MAX_ROWS = int(os.environ.get("BRIDGE_SPOOL_MAX_ROWS", 1000000))
+SPOOL_REPLAY_BATCH = int(os.environ.get("BRIDGE_SPOOL_REPLAY_BATCH", 2000))
+SPOOL_REPLAY_RATE = float(os.environ.get("BRIDGE_SPOOL_REPLAY_RATE", 5000))
+SPOOL_RETRY_INTERVAL = float(os.environ.get("BRIDGE_SPOOL_RETRY_INTERVAL", 10))
+STATS_INTERVAL = float(os.environ.get("BRIDGE_STATS_INTERVAL", 60))
+
+# Readings of each device and sensor are collected for POST_INTERVAL seconds and then
+# forwarded all at once ("raw") or as one reading holding their mean ("summary", which
+# stores nothing but the mean); "off" forwards every reading as it arrives
+POST_INTERVAL = float(os.environ.get("POST_INTERVAL", 5))
+AGGREGATE = os.environ.get("BRIDGE_AGGREGATE", "raw")
+if AGGREGATE not in ("summary", "raw", "off"):
+    raise ValueError(f"Invalid BRIDGE_AGGREGATE: {AGGREGATE}")
+
+# With BRIDGE_WORKERS > 1 a supervisor subscribes and routes each device to one of
+# that many worker processes. A worker that dies more than WORKER_MAX_RESTARTS times
+# within WORKER_RESTART_WINDOW seconds is left down for WORKER_RESTART_BACKOFF seconds
+# while its devices are spread over the other workers
+WORKERS = int(os.environ.get("BRIDGE_WORKERS", 1))
+WORKER_MAX_RESTARTS = int(os.environ.get("BRIDGE_WORKER_MAX_RESTARTS", 3))
+WORKER_RESTART_WINDOW = float(os.environ.get("BRIDGE_WORKER_RESTART_WINDOW", 60))
+WORKER_RESTART_BACKOFF = float(os.environ.get("BRIDGE_WORKER_RESTART_BACKOFF", 30))
+# Messages per worker the supervisor keeps until the worker has posted or spooled them,
+# to replay them to the next owner of the devices if the worker dies
+WORKER_REPLAY_SIZE = int(os.environ.get("BRIDGE_WORKER_REPLAY_SIZE", 4 * QUEUE_SIZE))
+
+
+def partition(device_id, count):
+    """Stable partition of a device ID; unlike hash() it is the same in every process."""
+    return zlib.crc32(device_id.encode()) % count
+
+def parse_readings(topic, payload, received_at):
+    """Turn a readings message into (sensor_type, reading) pairs for the server API."""
+    if topic != f"{base_topic}/readings":
+        return []
+    data = json.loads(payload.decode())
+    device_id = data.get("device_id", DEVICE_ID)
+    timestamp = data.get("timestamp") or received_at
+    readings = []
+    for sensor_type, unit in SENSOR_UNITS.items():
+        value = data.get(sensor_type)
+        if value is None:
+            continue
+        readings.append((sensor_type, {
+            "device_id": device_id,
+            "value": float(value),
+            "unit": data.get(f"{sensor_type}_unit", unit),
+            "timestamp": timestamp,
+        }))
+    return readings
+
+class WindowAggregator:
+    """
+    Collects readings per device and sensor until their window closes.
+
+    In raw mode every sample of a closed window is forwarded together. In
+    summary mode the window becomes one reading whose value is the mean of its
+    samples, stamped with the time of the last sample; the server stores only
+    that value, so the spread within the window is lost.
+    """
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.windows = {}  # (device_id, sensor_type) -> deque of readings
+
+    def add(self, sensor_type, reading):
+        self.windows.setdefault((reading["device_id"], sensor_type), deque()).append(reading)
+
+    def close(self):
+        """Close every open window and return the (sensor_type, reading) pairs to forward."""
+        windows, self.windows = self.windows, {}
+        forward = []
+        for (device_id, sensor_type), samples in windows.items():
+            if self.mode == "raw":
+                forward.extend((sensor_type, reading) for reading in samples)
+                continue
+            values = np.fromiter((reading["value"] for reading in samples), dtype=np.float64, count=len(samples))
+            last = samples[-1]
+            forward.append((sensor_type, {
+                "device_id": device_id,
+                "value": float(values.mean()),
+                "unit": last["unit"],
+                "timestamp": last["timestamp"],
+            }))
+        return forward
+
+
+class Marker:
+    """
+    Put into every forwarder queue behind the readings of the inbox messages up
+    to seq; once each forwarder has settled the batch holding it, so have they.
+    """
+
+    def __init__(self, seq, pending):
+        self.seq = seq
+        self.pending = pending
 
-    try:
-        response = requests.post(API_URL, json=payload)
-        if response.status_code == 200:
-            print(f"Temperature data posted: {payload}")
-        else:
-            print(f" Failed to post data. Status code: {response.status_code} - {response.text}")
-    except requests.exceptions.RequestException as e:
-        print(f" Error posting data: {e}")
 
 def on_connect(client, userdata, flags, rc):
     """Callback for when the client connects to the broker."""
@@ -59,82 +165,552 @@ def on_connect(client, userdata, flags, rc):
     else:
         print(f"Failed to connect with result code {rc}")
 
-
-        
-def on_message(client, userdata, msg):
-    """Callback for when a message is received."""
-    global last_post_time
-    try:
-        payload = json.loads(msg.payload.decode())  # Attempt to parse payload as JSON
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        # Print readings if topic matches the readings subtopic
-        if msg.topic == f"{base_topic}/readings":
-            #hall = payload.get("hall", "N/A")
-            temp = payload.get("temperature", "N/A")
-            pressure = payload.get("pressure", "N/A")
-            #timestamp = payload.get("timestamp", "N/A")
-            if temp is not None:
-                print(f"\n{current_time} Received Temperature: {temp} C")
-
-                # Only send POST request if 5 seconds have passed
-                if time.time() - last_post_time >= POST_INTERVAL:
-                    post_temperature_to_server(value=temp, unit="C", timestamp=current_time)
-                    last_post_time = time.time()
-                else:
-                    print(f"Skipping POST (waiting {POST_INTERVAL} seconds between requests)")
-            else:
-                print("Temperature value not found in payload")
-
-            
-            
-
-            print(f"\n{current_time} Received Readings:")
-            print(f"Topic: {msg.topic}")
-            #print(f"Hall Sensor: {hall}")
-            print(f"Pressure Sensor: {pressure} Pa" )
-            print(f"Temperature: {temp} C")
-           # print(f"ESP Timestamp: {timestamp} ms")
-
-    except json.JSONDecodeError:
-        print(f"\nReceived non-JSON message on {msg.topic}:")
-        print(f"Payload: {msg.payload.decode()}")
-        #payload_str = msg.payload.decode()
-        #print(f"\nReceived raw payload: {payload_str}")
-      
-
-    #except json.JSONDecodeError:
-        #print(f"\nNon-JSON message received on {msg.topic}: {msg.payload.decode()}")       
-            
-
-
-def main():
-    # Create MQTT client
-    print("Creating MQTT client...")
-    client = mqtt.Client()
-    # Set the callback functions onConnect and onMessage
-    print("Setting callback functions...")
+def create_client(on_message):
+    # paho-mqtt 2.x needs the callback API version; VERSION1 keeps the 1.x callback signatures
+    if hasattr(mqtt, "CallbackAPIVersion"):
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
+    else:
+        client = mqtt.Client()
     client.on_connect = on_connect
     client.on_message = on_message
-    
-    try:
-        # Connect to broker
-        print("Connecting to broker...")
-        client.connect(BROKER, PORT, keepalive=60)
-        
-        # Start the MQTT loop
-        print("Starting MQTT loop...")
-        client.loop_start()
+    return client
+
+def create_session():
+    """HTTP session keeping up to FORWARDERS keep-alive connections to the API."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=FORWARDERS)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def retry_delay(attempt):
+    """Full-jitter exponential backoff, so retrying bridges do not hit the API in lockstep."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class Bridge:
+    """
+    Forwards MQTT sensor readings to the FastAPI server.
+
+    The paho network thread only hands messages to the event loop, which
+    queues them in bounded queues, one per forwarder task. Each device's
+    readings always go to the same forwarder, which takes batches off its
+    queue and posts each batch in one request over a shared keep-alive
+    session, so readings of a device are posted in order and a slow API never
+    holds up MQTT delivery; when a queue is full, new messages are dropped
+    and counted.
+
+    Batches that still fail after retrying go to the on-disk spool, and while
+    the API is down new batches are spooled straight away. A drain task
+    replays the spool in large, rate-limited batches once the API answers.
+
+    A worker bridge (subscribe=False) has no MQTT client of its own; its
+    messages are handed to enqueue() by whoever runs it, numbered, and the
+    bridge stores in acked the number up to which they are posted, spooled or
+    given up on.
+    """
+
+    def __init__(self, loop, spool_path=SPOOL_PATH, subscribe=True, name="Bridge", acked=None):
+        self.loop = loop
+        self.name = name
+        self.queues = [asyncio.Queue(maxsize=max(1, QUEUE_SIZE // FORWARDERS)) for _ in range(FORWARDERS)]
+        self.executor = ThreadPoolExecutor(max_workers=FORWARDERS, thread_name_prefix="forward")
+        self.session = create_session()
+        # SQLite calls run on their own thread, one at a time
+        self.spool_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="spool")
+        self.spool = Spool(spool_path, SPOOL_MAX_ROWS)
+        self.api_down = False
+        self.replay_rate = 0.0  # readings per second during the last drain
+        self.stopping = asyncio.Event()
+        self.aggregator = WindowAggregator(AGGREGATE) if AGGREGATE != "off" and POST_INTERVAL > 0 else None
+        self.acked = acked  # shared with the supervisor
+        self.received_seq = 0
+        self.stats = {
+            "received": 0,
+            "forwarded": 0,
+            "rejected": 0,
+            "aggregated": 0,
+            "failed": 0,
+            "dropped": 0,
+            "invalid": 0,
+            "batches": 0,
+            "retries": 0,
+        }
+
+        self.client = create_client(self.on_message) if subscribe else None
+
+    def on_message(self, client, userdata, msg):
+        """Callback for when a message is received. Runs on the paho network thread."""
+        self.loop.call_soon_threadsafe(self.enqueue, msg.topic, msg.payload)
+
+    def enqueue(self, topic, payload, seq=None):
+        self.stats["received"] += 1
+        if seq is not None:
+            self.received_seq = seq
+        received_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            readings = parse_readings(topic, payload, received_at)
+        except (ValueError, TypeError, AttributeError):
+            self.stats["invalid"] += 1
+            print(f"Ignoring malformed message on {topic}: {payload[:200]!r}")
+            return
+        if self.aggregator:
+            for sensor_type, reading in readings:
+                self.aggregator.add(sensor_type, reading)
+            self.stats["aggregated"] += len(readings)
+        else:
+            self.put(readings)
+
+    def put(self, readings):
+        for sensor_type, reading in readings:
+            try:
+                self.queues[partition(reading["device_id"], FORWARDERS)].put_nowait((sensor_type, reading))
+            except asyncio.QueueFull:
+                self.stats["dropped"] += 1
+
+    def queued(self):
+        return sum(q.qsize() for q in self.queues)
+
+    def mark(self):
+        """Queue a marker behind the readings of every message received so far, if all queues have room."""
+        if self.acked is None or any(q.full() for q in self.queues):
+            return
+        marker = Marker(self.received_seq, len(self.queues))
+        for q in self.queues:
+            q.put_nowait(marker)
+
+    def settle(self, marker):
+        marker.pending -= 1
+        if not marker.pending and marker.seq > self.acked.value:
+            self.acked.value = marker.seq
+
+    async def acknowledge(self):
+        """Without windows to close, mark the messages received so far every BATCH_WINDOW seconds."""
+        while True:
+            await asyncio.sleep(BATCH_WINDOW)
+            self.mark()
+
+    async def close_windows(self):
+        """Forward the aggregated readings at the end of every POST_INTERVAL window."""
+        while True:
+            # Align windows to the clock so they line up across restarts and bridges
+            await asyncio.sleep(POST_INTERVAL - time.time() % POST_INTERVAL)
+            self.put(self.aggregator.close())
+            # Readings of the messages received until now have all left the windows
+            self.mark()
+
+    def post(self, items):
+        """Send a batch of readings to the FastAPI server. Runs on the forwarder thread pool."""
+        return self.session.post(f"{API_BASE_URL}/api/sensor/batch", json=items, timeout=REQUEST_TIMEOUT)
+
+    async def next_batch(self, readings):
+        batch = [await readings.get()]
+        deadline = self.loop.time() + BATCH_WINDOW
+        while len(batch) < BATCH_SIZE:
+            try:
+                batch.append(readings.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - self.loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(readings.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def send(self, items, retries=MAX_RETRIES):
+        """
+        Post a batch, retrying connection errors and retryable statuses.
+
+        Returns True once the server took the batch, False if the server refused
+        it (retrying would not help) and None if the API could not be reached or
+        never gave a usable answer.
+        """
+        for attempt in range(retries + 1):
+            if attempt:
+                self.stats["retries"] += 1
+                await asyncio.sleep(retry_delay(attempt))
+            try:
+                response = await self.loop.run_in_executor(self.executor, self.post, items)
+            except requests.exceptions.RequestException as e:
+                print(f"Error posting {len(items)} readings (attempt {attempt + 1}/{retries + 1}): {e}")
+                continue
+            if response.status_code in RETRY_STATUS:
+                print(f"Server answered {response.status_code} (attempt {attempt + 1}/{retries + 1}): {response.text[:200]}")
+                continue
+            self.api_down = False
+            if response.status_code >= 400:
+                # The request itself is wrong; sending it again would not help
+                print(f"Failed to post data. Status code: {response.status_code} - {response.text[:200]}")
+                return False
+            try:
+                result = response.json()
+                accepted, rejected = int(result["accepted"]), int(result["rejected"])
+                errors = [item for item in result["results"] if not item["success"]]
+                if errors:
+                    print(f"Server rejected {len(errors)} readings, e.g. {items[errors[0]['index']]}: {errors[0]['error']}")
+            except (ValueError, KeyError, IndexError, TypeError) as e:
+                # Not an answer from the batch endpoint (a proxy page, a truncated body); try again
+                print(f"Unexpected response to {len(items)} readings (attempt {attempt + 1}/{retries + 1}): "
+                      f"{e!r} - {response.text[:200]}")
+                continue
+            self.stats["forwarded"] += accepted
+            self.stats["rejected"] += rejected
+            return True
+        self.api_down = True
+        return None
+
+    async def in_spool_thread(self, func, *args):
+        return await self.loop.run_in_executor(self.spool_executor, func, *args)
+
+    async def spool_put(self, items):
+        try:
+            await self.in_spool_thread(self.spool.put, items)
+        except sqlite3.Error as e:
+            # A full disk or locked database must not stop forwarding; these readings are lost
+            self.stats["dropped"] += len(items)
+            print(f"{self.name}: could not spool {len(items)} readings, dropping them: {e}")
+
+    async def forward(self, readings):
+        while True:
+            batch = await self.next_batch(readings)
+            markers = [item for item in batch if isinstance(item, Marker)]
+            pairs = [item for item in batch if not isinstance(item, Marker)]
+            try:
+                if pairs:
+                    self.stats["batches"] += 1
+                    items = [{"sensor_type": sensor_type, **reading} for sensor_type, reading in pairs]
+                    # While the API is down, skip the retries and leave recovery to the drain task
+                    sent = None if self.api_down else await self.send(items)
+                    if sent is None:
+                        await self.spool_put(items)
+                    elif not sent:
+                        self.stats["failed"] += len(items)
+            except Exception as e:
+                # Losing one batch is better than losing the forwarder and everything queued behind it
+                self.stats["failed"] += len(pairs)
+                print(f"{self.name}: dropped a batch of {len(pairs)} readings after an unexpected error: {e!r}")
+            finally:
+                for _ in batch:
+                    readings.task_done()
+                for marker in markers:
+                    self.settle(marker)
+
+    async def drain(self):
+        """Replay spooled readings in rate-limited batches whenever the API is reachable."""
         while True:
-            pass
-    except KeyboardInterrupt:
-        print("\nDisconnecting from broker...")
-        # make sure to stop the loop and disconnect from the broker
-        client.loop_stop()
-        client.disconnect()
-        print("Exited successfully")
-    except Exception as e:
-        print(f"Error: {e}")
+            if not self.spool.depth:
+                await asyncio.sleep(SPOOL_RETRY_INTERVAL)
+                continue
+            started, replayed = time.monotonic(), 0
+            try:
+                while self.spool.depth:
+                    last_id, items = await self.in_spool_thread(self.spool.peek, SPOOL_REPLAY_BATCH)
+                    sent = await self.send(items, retries=0)
+                    if sent is None:
+                        break
+                    if not sent:
+                        self.stats["failed"] += len(items)
+                    await self.in_spool_thread(self.spool.ack, last_id)
+                    replayed += len(items)
+                    self.replay_rate = replayed / (time.monotonic() - started)
+                    # Pace the replay so recovery does not swamp the API
+                    await asyncio.sleep(max(0.0, replayed / SPOOL_REPLAY_RATE - (time.monotonic() - started)))
+                if not self.spool.depth:
+                    await self.in_spool_thread(self.spool.compact)
+            except sqlite3.Error as e:
+                # Unacknowledged readings stay spooled and are replayed on the next attempt
+                print(f"{self.name}: spool replay failed, retrying in {SPOOL_RETRY_INTERVAL:.0f}s: {e}")
+            if replayed:
+                print(f"Replayed {replayed} spooled readings at {self.replay_rate:.0f} readings/s, {self.spool.depth} left")
+            await asyncio.sleep(SPOOL_RETRY_INTERVAL)
+
+    async def report(self):
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            print(f"{self.name} stats: {self.stats} queue={self.queued()}/{QUEUE_SIZE} spool={self.spool_stats()}")
+
+    def spool_stats(self):
+        return {
+            "depth": self.spool.depth,
+            "bytes": self.spool.size_bytes(),
+            "replay_rate": round(self.replay_rate, 1),
+            **self.spool.stats,
+        }
+
+    async def run(self, signals=(signal.SIGINT, signal.SIGTERM)):
+        for sig in signals:
+            self.loop.add_signal_handler(sig, self.stopping.set)
+
+        tasks = [asyncio.create_task(self.forward(readings)) for readings in self.queues]
+        tasks.append(asyncio.create_task(self.report()))
+        tasks.append(asyncio.create_task(self.drain()))
+        if self.aggregator:
+            tasks.append(asyncio.create_task(self.close_windows()))
+        elif self.acked is not None:
+            tasks.append(asyncio.create_task(self.acknowledge()))
+        if self.spool.depth:
+            print(f"{self.name}: {self.spool.depth} readings spooled from an earlier run will be replayed")
+
+        if self.client:
+            print("Connecting to broker...")
+            self.client.connect_async(BROKER, PORT, keepalive=60)
+            self.client.loop_start()
+        try:
+            # Nothing to do until a signal arrives; the process sleeps meanwhile
+            await self.stopping.wait()
+        finally:
+            if self.client:
+                print("\nDisconnecting from broker...")
+                self.client.disconnect()
+                self.client.loop_stop()
+            if self.aggregator:
+                self.put(self.aggregator.close())
+            self.mark()
+            try:
+                await asyncio.wait_for(asyncio.gather(*(q.join() for q in self.queues)), REQUEST_TIMEOUT)
+            except asyncio.TimeoutError:
+                print(f"{self.name}: gave up on {self.queued()} queued readings")
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.executor.shutdown(wait=True)
+            self.spool_executor.submit(self.spool.close)
+            self.spool_executor.shutdown(wait=True)
+            self.session.close()
+            print(f"{self.name} stats: {self.stats} spool={self.spool_stats()}")
+            print(f"{self.name} exited successfully")
+
+
+def worker_spool_path(index):
+    root, extension = os.path.splitext(SPOOL_PATH)
+    return f"{root}-{index}{extension}"
+
+async def work(index, inbox, acked):
+    loop = asyncio.get_running_loop()
+    bridge = Bridge(loop, spool_path=worker_spool_path(index), subscribe=False, name=f"Worker {index}",
+                    acked=acked)
+
+    def feed():
+        # Blocking reads stay off the event loop; None from the supervisor means stop
+        for message in iter(inbox.get, None):
+            loop.call_soon_threadsafe(bridge.enqueue, *message)
+        loop.call_soon_threadsafe(bridge.stopping.set)
+
+    threading.Thread(target=feed, name="inbox", daemon=True).start()
+    await bridge.run(signals=(signal.SIGTERM,))
+
+def run_worker(index, inbox, acked):
+    """Entry point of a worker process, which forwards the messages routed to its inbox."""
+    # Ctrl+C reaches the whole process group; workers wait for the supervisor to stop them
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(work(index, inbox, acked))
+
+
+class Supervisor:
+    """
+    Subscribes once and spreads devices over WORKERS bridge processes.
+
+    Each device belongs to the worker of its partition, and every worker
+    reads its messages from its own FIFO inbox, so the readings of a device
+    are forwarded in order by a single process while the parsing, batching,
+    posting and spooling of different devices run on separate cores.
+
+    Messages are numbered per worker and kept in a replay buffer until the
+    worker reports them posted or spooled. When a worker dies it is started
+    again for the same partition and spool with a new inbox, and its buffered
+    messages are replayed to it before any newer ones; readings it had posted
+    but not yet reported may be posted twice. A worker that keeps crashing is
+    left down for WORKER_RESTART_BACKOFF seconds, and its buffered and new
+    messages go to the remaining workers meanwhile. A device stays with the
+    worker holding its unsettled messages until they are settled, so moving
+    devices between workers does not reorder them.
+    """
+
+    def __init__(self, workers):
+        # Workers are restarted while the paho thread runs, and forking a threaded process is unsafe
+        self.context = multiprocessing.get_context("spawn")
+        self.count = workers
+        self.processes = [None] * workers
+        self.inboxes = [None] * workers
+        self.alive = ()  # partitions whose worker is running
+        self.sequence = [0] * workers  # number of the last message routed to each worker
+        self.acked = [None] * workers  # shared values: last message each worker has settled
+        self.unsettled = [deque() for _ in range(workers)]  # (seq, topic, payload) not yet settled
+        self.placement = {}  # device_id -> (worker, seq) of its last message
+        self.restarts = [deque() for _ in range(workers)]  # times of recent restarts
+        self.retry_at = {}  # partition -> when to start its worker again
+        # Held while routing a message and while a partition changes hands, so neither sees half of the other
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.stats = {"received": 0, "routed": 0, "replayed": 0, "unbuffered": 0, "dropped": 0, "restarts": 0}
+        self.client = create_client(self.on_message)
+
+    def on_message(self, client, userdata, msg):
+        """Route a message to the worker owning its device. Runs on the paho network thread."""
+        self.stats["received"] += 1
+        if msg.topic != f"{base_topic}/readings":
+            return
+        with self.lock:
+            self.route(msg.topic, msg.payload)
+
+    def owner(self, device_id):
+        placed = self.placement.get(device_id)
+        if placed and placed[0] in self.alive and placed[1] > self.acked[placed[0]].value:
+            # Earlier messages of the device are still unsettled there; keep them in order
+            return placed[0]
+        owner = partition(device_id, self.count)
+        if owner not in self.alive:
+            owner = self.alive[partition(device_id, len(self.alive))]
+        return owner
+
+    def route(self, topic, payload):
+        """Hand a message to its device's worker and buffer it until settled. Call with the lock held."""
+        try:
+            device_id = str(json.loads(payload.decode()).get("device_id", DEVICE_ID))
+        except (ValueError, AttributeError):
+            # Any worker will do; it reports the message as malformed
+            device_id = DEVICE_ID
+        if not self.alive:
+            self.stats["dropped"] += 1
+            return
+        owner = self.owner(device_id)
+        seq = self.sequence[owner] + 1
+        try:
+            self.inboxes[owner].put_nowait((topic, payload, seq))
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return
+        self.sequence[owner] = seq
+        self.placement[device_id] = (owner, seq)
+        self.stats["routed"] += 1
+        unsettled = self.unsettled[owner]
+        acked = self.acked[owner].value
+        while unsettled and unsettled[0][0] <= acked:
+            unsettled.popleft()
+        if len(unsettled) >= WORKER_REPLAY_SIZE:
+            # Still delivered, but no longer replayed should the worker die
+            unsettled.popleft()
+            self.stats["unbuffered"] += 1
+        unsettled.append((seq, topic, payload))
+
+    def release(self, index):
+        """Close a dead worker's inbox and return its unsettled messages. Call with the lock held."""
+        acked = self.acked[index].value
+        unsettled = [(topic, payload) for seq, topic, payload in self.unsettled[index] if seq > acked]
+        self.unsettled[index] = deque()
+        inbox, self.inboxes[index] = self.inboxes[index], None
+        # Its contents are all in the buffer; do not wait at exit for them to reach the dead reader
+        inbox.cancel_join_thread()
+        inbox.close()
+        return unsettled
+
+    def replay(self, messages):
+        """Route a dead worker's unsettled messages again, ahead of newer ones. Call with the lock held."""
+        for message in messages:
+            self.route(*message)
+            self.stats["replayed"] += 1
+        if messages:
+            print(f"Replayed {len(messages)} unsettled messages of a dead worker")
+
+    def start(self, index):
+        """Start the worker of a partition, replaying what its previous worker left unsettled."""
+        inbox = self.context.Queue(maxsize=QUEUE_SIZE)
+        # Numbering carries on, so older placements of the partition count as settled
+        acked = self.context.Value("q", self.sequence[index], lock=False)
+        with self.lock:
+            unsettled = self.release(index) if self.inboxes[index] is not None else []
+            self.inboxes[index], self.acked[index] = inbox, acked
+            self.alive = tuple(sorted(set(self.alive) | {index}))
+            # Routed before the process starts; the new worker reads them first
+            self.replay(unsettled)
+        process = self.context.Process(target=run_worker, args=(index, inbox, acked), name=f"bridge-worker-{index}")
+        process.start()
+        self.processes[index] = process
+        print(f"Started worker {index} (pid {process.pid})")
+
+    def lost(self, index):
+        process = self.processes[index]
+        process.join()
+        if self.stopping.is_set():
+            with self.lock:
+                self.alive = tuple(i for i in self.alive if i != index)
+            return
+        print(f"Worker {index} (pid {process.pid}) exited with code {process.exitcode}")
+        now = time.monotonic()
+        restarts = self.restarts[index]
+        while restarts and now - restarts[0] > WORKER_RESTART_WINDOW:
+            restarts.popleft()
+        if len(restarts) >= WORKER_MAX_RESTARTS:
+            with self.lock:
+                self.alive = tuple(i for i in self.alive if i != index)
+                print(f"Worker {index} keeps failing; its devices go to workers {list(self.alive)} "
+                      f"for the next {WORKER_RESTART_BACKOFF:.0f}s")
+                self.replay(self.release(index))
+            self.retry_at[index] = now + WORKER_RESTART_BACKOFF
+            return
+        restarts.append(now)
+        self.stats["restarts"] += 1
+        # The partition stays alive meanwhile: new messages wait in the new inbox behind the replayed ones
+        self.start(index)
+
+    def stop(self, *args):
+        self.stopping.set()
+
+    def run(self):
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, self.stop)
+        for index in range(self.count):
+            self.start(index)
+
+        print(f"Connecting to broker with {self.count} workers...")
+        self.client.connect_async(BROKER, PORT, keepalive=60)
+        self.client.loop_start()
+        reported = time.monotonic()
+        try:
+            while not self.stopping.is_set():
+                # Sleeps until a worker exits, waking up now and then for restarts, stats and signals
+                sentinels = {self.processes[index].sentinel: index for index in self.alive}
+                for sentinel in wait(list(sentinels), timeout=1.0):
+                    self.lost(sentinels[sentinel])
+                now = time.monotonic()
+                for index, retry_at in list(self.retry_at.items()):
+                    if now >= retry_at and not self.stopping.is_set():
+                        del self.retry_at[index]
+                        self.start(index)
+                if now - reported >= STATS_INTERVAL:
+                    reported = now
+                    print(f"Supervisor stats: {self.stats} workers={list(self.alive)}")
+        finally:
+            print("\nDisconnecting from broker...")
+            self.client.disconnect()
+            self.client.loop_stop()
+            with self.lock:
+                alive, self.alive = self.alive, ()
+            for index in alive:
+                self.inboxes[index].put(None)
+            # A worker flushes its windows and waits up to REQUEST_TIMEOUT for its queues to drain
+            deadline = time.monotonic() + 2 * REQUEST_TIMEOUT
+            for index in alive:
+                process = self.processes[index]
+                process.join(max(0.0, deadline - time.monotonic()))
+                if process.is_alive():
+                    print(f"Worker {index} did not stop in time, terminating it")
+                    process.terminate()
+                    process.join()
+            print(f"Supervisor stats: {self.stats}")
+            print("Exited successfully")
+
+
+async def main():
+    bridge = Bridge(asyncio.get_running_loop())
+    await bridge.run()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if WORKERS > 1:
+        Supervisor(WORKERS).run()
+    else:
+        asyncio.run(main())
@@ -0,0 +1,79 @@
+import json
+import os
+import sqlite3
+
+
+class Spool:
+    """
+    Disk-backed FIFO of readings the bridge could not forward.
+
+    Readings are stored one per row in an SQLite database in WAL mode, so
+    appends are cheap and survive a crash or restart. Once more than
+    `max_rows` readings are spooled the oldest ones are dropped. Not thread
+    safe: use it from one thread at a time.
+    """
+
+    def __init__(self, path, max_rows=1000000):
+        self.path = path
+        self.max_rows = max_rows
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # Losing the last transactions on power loss is acceptable, fsync per append is not
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS spool (id INTEGER PRIMARY KEY AUTOINCREMENT, reading TEXT NOT NULL)")
+        self.depth = self.db.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+        self.stats = {"spooled": 0, "replayed": 0, "dropped": 0, "compactions": 0}
+
+    def put(self, readings):
+        """Append readings, dropping the oldest spooled ones beyond max_rows."""
+        excess = max(0, self.depth + len(readings) - self.max_rows)
+        # Counters change only once the transaction committed; a failed put leaves the spool as it was
+        with self.db:
+            self.db.execute("BEGIN")
+            self.db.executemany("INSERT INTO spool (reading) VALUES (?)", ((json.dumps(r),) for r in readings))
+            if excess:
+                self.db.execute(
+                    "DELETE FROM spool WHERE id IN (SELECT id FROM spool ORDER BY id LIMIT ?)", (excess,)
+                )
+        self.depth += len(readings) - excess
+        self.stats["spooled"] += len(readings)
+        self.stats["dropped"] += excess
+
+    def peek(self, limit):
+        """Return up to limit of the oldest readings as (last_id, readings)."""
+        rows = self.db.execute("SELECT id, reading FROM spool ORDER BY id LIMIT ?", (limit,)).fetchall()
+        if not rows:
+            return None, []
+        return rows[-1][0], [json.loads(reading) for _, reading in rows]
+
+    def ack(self, last_id):
+        """Remove every reading up to and including last_id after it was replayed."""
+        with self.db:
+            self.db.execute("BEGIN")
+            removed = self.db.execute("DELETE FROM spool WHERE id <= ?", (last_id,)).rowcount
+        self.depth -= removed
+        self.stats["replayed"] += removed
+
+    def compact(self):
+        """Fold the WAL back into the database and give freed pages back to the file system."""
+        self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        page_count = self.db.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = self.db.execute("PRAGMA freelist_count").fetchone()[0]
+        if page_count and free_pages * 2 >= page_count:
+            self.db.execute("VACUUM")
+            self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.stats["compactions"] += 1
+
+    def size_bytes(self):
+        return sum(
+            os.path.getsize(self.path + suffix)
+            for suffix in ("", "-wal")
+            if os.path.exists(self.path + suffix)
+        )
+
+    def close(self):
+        self.db.close()
+
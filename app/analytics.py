@@ -0,0 +1,161 @@
+"""
+Statistics over ranges of sensor readings.
+
+Readings are streamed from a server-side cursor and folded chunk by chunk
+into fixed-size NumPy accumulators, so ranges larger than memory can be
+summarised: mean and standard deviation are merged per chunk, percentiles
+come from a histogram over the value range, and rolling averages are built
+from per-step sums and counts.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.database import EPOCH, iter_sensor_readings, run_in_executor
+
+# Histogram resolution for percentiles: each is exact to (max - min) / HISTOGRAM_BINS
+HISTOGRAM_BINS = 4096
+
+
+class ReadingStats:
+    """
+    Chunked reduction of one device's readings.
+
+    Chunks may arrive in either time order, as long as the order is the same
+    for every chunk. Time is handled as epoch seconds.
+    """
+
+    def __init__(self, low: float, high: float, first: int, step: int):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0  # sum of squared deviations from the mean
+        self.min = np.inf
+        self.max = -np.inf
+        self._range = (low, high) if high > low else (low - 0.5, low + 0.5)
+        self.histogram = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+        self.first = first - first % step
+        self.step = step
+        self.step_sums = np.zeros(0)
+        self.step_counts = np.zeros(0, dtype=np.int64)
+        self._previous: Optional[tuple] = None
+        self.rate_count = 0
+        self.rate_sum = 0.0
+        self.rate_min = np.inf
+        self.rate_max = -np.inf
+
+    def add(self, timestamps: np.ndarray, values: np.ndarray):
+        """Fold a chunk of epoch-second timestamps and values into the statistics."""
+        if not len(values):
+            return
+        # Merge mean and squared deviations (Chan et al.)
+        count = len(values)
+        mean = values.mean()
+        m2 = ((values - mean) ** 2).sum()
+        delta = mean - self.mean
+        total = self.count + count
+        self.mean += delta * count / total
+        self._m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+        # Readings that arrived after the range was measured land in the outer bins
+        self.histogram += np.histogram(np.clip(values, *self._range), bins=HISTOGRAM_BINS, range=self._range)[0]
+
+        # Readings older than the measured first one can only be late arrivals; count them in the first step
+        steps = np.maximum((timestamps - self.first) // self.step, 0)
+        size = int(steps.max()) + 1
+        if size > len(self.step_sums):
+            self.step_sums = np.pad(self.step_sums, (0, size - len(self.step_sums)))
+            self.step_counts = np.pad(self.step_counts, (0, size - len(self.step_counts)))
+        self.step_sums[:size] += np.bincount(steps, weights=values, minlength=size)
+        self.step_counts[:size] += np.bincount(steps, minlength=size)
+
+        # Rate of change between consecutive readings, including across chunks
+        if self._previous is not None:
+            timestamps = np.concatenate(([self._previous[0]], timestamps))
+            values = np.concatenate(([self._previous[1]], values))
+        self._previous = (timestamps[-1], values[-1])
+        elapsed = np.diff(timestamps)
+        moving = elapsed != 0
+        rates = np.diff(values)[moving] / elapsed[moving]
+        if len(rates):
+            self.rate_count += len(rates)
+            self.rate_sum += rates.sum()
+            self.rate_min = min(self.rate_min, rates.min())
+            self.rate_max = max(self.rate_max, rates.max())
+
+    def std(self) -> float:
+        return float(np.sqrt(self._m2 / self.count)) if self.count else None
+
+    def percentiles(self, quantiles: List[float]) -> Dict[str, float]:
+        """Approximate percentiles by interpolating within histogram bins."""
+        if not self.count:
+            return {f"p{q:g}": None for q in quantiles}
+        edges = np.linspace(*self._range, HISTOGRAM_BINS + 1)
+        cumulative = np.cumsum(self.histogram)
+        ranks = np.asarray(quantiles) / 100 * self.count
+        bins = np.minimum(np.searchsorted(cumulative, ranks), HISTOGRAM_BINS - 1)
+        before = np.where(bins > 0, cumulative[bins - 1], 0)
+        fraction = (ranks - before) / np.maximum(self.histogram[bins], 1)
+        values = np.clip(edges[bins] + fraction * (edges[bins + 1] - edges[bins]), self.min, self.max)
+        return {f"p{q:g}": float(value) for q, value in zip(quantiles, values)}
+
+    def rolling_mean(self, window: int) -> Dict[str, list]:
+        """Mean over the trailing window seconds at the end of every step that has readings."""
+        steps = window // self.step
+        sums = np.cumsum(self.step_sums)
+        counts = np.cumsum(self.step_counts)
+        sums[steps:] = sums[steps:] - sums[:-steps].copy()
+        counts[steps:] = counts[steps:] - counts[:-steps].copy()
+        present = np.nonzero(self.step_counts)[0]
+        return {
+            "timestamps": [
+                (EPOCH + timedelta(seconds=int(self.first + (index + 1) * self.step))).strftime('%Y-%m-%d %H:%M:%S')
+                for index in present
+            ],
+            "values": (sums[present] / counts[present]).tolist(),
+        }
+
+    def result(self, quantiles: List[float], window: int) -> Dict:
+        return {
+            "count": self.count,
+            "mean": float(self.mean) if self.count else None,
+            "std": self.std(),
+            "min": float(self.min) if self.count else None,
+            "max": float(self.max) if self.count else None,
+            "percentiles": self.percentiles(quantiles),
+            "rate_of_change": {
+                "unit": "per second",
+                "mean": self.rate_sum / self.rate_count if self.rate_count else None,
+                "min": float(self.rate_min) if self.rate_count else None,
+                "max": float(self.rate_max) if self.rate_count else None,
+            },
+            "rolling_mean": {"window": window, "step": self.step, **self.rolling_mean(window)},
+        }
+
+
+def _epoch_seconds(timestamps) -> np.ndarray:
+    return np.array(timestamps, dtype="datetime64[s]").astype(np.int64)
+
+@run_in_executor
+def compute_reading_stats(sensor_type: str, device_id: str, summary: Dict, start_date: datetime,
+                          end_date: datetime, step: int, window: int, quantiles: List[float]) -> Dict:
+    """Stream a device's readings through ReadingStats; summary holds their min/max value and first time."""
+    stats = ReadingStats(summary["min"], summary["max"], int(_epoch_seconds([summary["first"]])[0]), step)
+    for rows in iter_sensor_readings(sensor_type, device_id, None, start_date, end_date):
+        _, _, timestamps, values, _ = zip(*rows)
+        stats.add(_epoch_seconds(timestamps), np.array(values, dtype=np.float64))
+    return stats.result(quantiles, window)
+
+def correlation(left: List[Dict], right: List[Dict], column: str = "avg") -> Dict:
+    """Pearson correlation of two bucketed series over the buckets present in both."""
+    left_times = _epoch_seconds([row["timestamp"] for row in left])
+    right_times = _epoch_seconds([row["timestamp"] for row in right])
+    _, left_index, right_index = np.intersect1d(left_times, right_times, return_indices=True)
+    x = np.array([left[i][column] for i in left_index], dtype=np.float64)
+    y = np.array([right[i][column] for i in right_index], dtype=np.float64)
+    if len(x) < 3 or x.std() == 0 or y.std() == 0:
+        return {"buckets": int(len(x)), "r": None}
+    return {"buckets": int(len(x)), "r": float(np.corrcoef(x, y)[0, 1])}
@@ -0,0 +1,163 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire after a time-to-live.
+
+    Once `maxsize` entries are stored, the least recently used entry is evicted.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value for key, or default if it is missing or expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store value under key for ttl seconds (defaults to the cache TTL)."""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove key from the cache and return its value."""
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def discard_where(self, predicate) -> int:
+        """Remove every entry whose value matches predicate and return how many were removed."""
+        with self._lock:
+            keys = [key for key, (value, _) in self._data.items() if predicate(value)]
+            for key in keys:
+                del self._data[key]
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict:
+        """Return the cache size and hit/miss counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class DeviceRegistry:
+    """
+    In-memory map of registered device IDs to the users that own them.
+
+    Loaded from the database at startup, updated when devices are added or
+    deleted, and periodically reloaded so workers converge on the same view.
+    """
+
+    def __init__(self):
+        self._owners: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self.loaded_at: Optional[float] = None
+
+    def load(self, pairs):
+        """Replace the registry with (device_id, user_id) pairs."""
+        owners: Dict[str, set] = {}
+        for device_id, user_id in pairs:
+            owners.setdefault(device_id, set()).add(user_id)
+        with self._lock:
+            self._owners = owners
+            self.loaded_at = time.monotonic()
+
+    def add(self, device_id: str, user_id: int):
+        with self._lock:
+            self._owners.setdefault(device_id, set()).add(user_id)
+
+    def remove(self, device_id: str, user_id: int):
+        with self._lock:
+            owners = self._owners.get(device_id)
+            if owners is not None:
+                owners.discard(user_id)
+                if not owners:
+                    del self._owners[device_id]
+
+    def __contains__(self, device_id: str) -> bool:
+        return device_id in self._owners
+
+    def stats(self) -> Dict:
+        return {
+            "devices": len(self._owners),
+            "age_seconds": time.monotonic() - self.loaded_at if self.loaded_at else None,
+        }
+
+
+class LatestReadingCache:
+    """
+    Latest reading per (sensor_type, device_id).
+
+    Warmed from the database at startup and updated by the ingest path, so the
+    latest-value endpoints answer from memory. With a ttl, entries older than
+    ttl seconds are treated as missing, which lets several workers converge.
+    """
+
+    def __init__(self, ttl: float = 0):
+        self.ttl = ttl
+        self._readings: Dict[tuple, tuple] = {}  # key -> (reading, stored_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def update(self, sensor_type: str, device_id: str, reading: Dict):
+        """Store reading unless a newer one is already cached."""
+        key = (sensor_type, device_id)
+        with self._lock:
+            current = self._readings.get(key)
+            if current is None or reading["timestamp"] >= current[0]["timestamp"]:
+                self._readings[key] = (reading, time.monotonic())
+
+    def get(self, sensor_type: str, device_id: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._readings.get((sensor_type, device_id))
+            if entry is None or (self.ttl and time.monotonic() - entry[1] > self.ttl):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(entry[0])
+
+    def stats(self) -> Dict:
+        return {"size": len(self._readings), "ttl": self.ttl, "hits": self.hits, "misses": self.misses}
@@ -1,11 +1,17 @@
+import asyncio
+import functools
+import math
 import os
 import time
 import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import mysql.connector as mysql
-from typing import Optional, Dict
+from typing import Optional, Dict, Tuple
 from dotenv import load_dotenv
 from mysql.connector import Error
-from datetime import datetime
+from datetime import datetime, timedelta
 import decimal
 
 # Load environment variables
@@ -18,28 +24,46 @@ class DatabaseConnectionError(Exception):
     """Custom exception for database connection failures"""
     pass
 
-def get_db_connection(max_retries: int = 12, retry_delay: int = 5) -> mysql.MySQLConnection:
-    """Create database connection with retry mechanism."""
+def _setting(prefix: str, name: str) -> str:
+    """Read a connection setting, falling back from e.g. MYSQL_REPLICA_USER to MYSQL_USER when unset or blank."""
+    value = os.environ.get(f"{prefix}_{name}")
+    return value if value else os.environ[f"MYSQL_{name}"]
+
+def _open_connection(max_retries: int = 12, retry_delay: int = 5, prefix: str = "MYSQL",
+                     read_only: bool = False, connection_timeout: Optional[int] = None) -> mysql.MySQLConnection:
+    """
+    Open a new physical database connection with retry mechanism.
+
+    The default retries wait out a database that is still starting; callers
+    that must answer quickly pass max_retries=1 and a connection_timeout.
+    """
     connection: Optional[mysql.MySQLConnection] = None
     attempt = 1
     last_error = None
 
+    timeout = {"connection_timeout": connection_timeout} if connection_timeout else {}
     while attempt <= max_retries:
         try:
             connection = mysql.connect(
-                host=os.environ['MYSQL_HOST'],
-                user=os.environ['MYSQL_USER'],
-                password=os.environ['MYSQL_PASSWORD'],
-                database=os.environ['MYSQL_DATABASE'],
-                port=os.environ['MYSQL_PORT'],
-                ssl_ca=os.environ['MYSQL_SSL_CA']
+                host=_setting(prefix, 'HOST'),
+                user=_setting(prefix, 'USER'),
+                password=_setting(prefix, 'PASSWORD'),
+                database=_setting(prefix, 'DATABASE'),
+                port=_setting(prefix, 'PORT'),
+                ssl_ca=_setting(prefix, 'SSL_CA'),
+                **timeout
             )
             connection.ping(reconnect=True, attempts=1, delay=0)
-            logger.info("Database connection established successfully")
+            if read_only:
+                cursor = connection.cursor()
+                cursor.execute("SET SESSION TRANSACTION READ ONLY")
+                cursor.close()
+            logger.info(f"Database connection established successfully ({_setting(prefix, 'HOST')})")
             return connection
         except Error as err:
             last_error = err
-            logger.warning(f"Connection attempt {attempt}/{max_retries} failed: {err}. Retrying in {retry_delay} seconds...")
+            retrying = f" Retrying in {retry_delay} seconds..." if attempt < max_retries else ""
+            logger.warning(f"Connection attempt {attempt}/{max_retries} failed: {err}.{retrying}")
             if connection is not None:
                 try:
                     connection.close()
@@ -51,185 +75,417 @@ def get_db_connection(max_retries: int = 12, retry_delay: int = 5) -> mysql.MySQ
             attempt += 1
     raise DatabaseConnectionError(f"Failed to connect to database after {max_retries} attempts. Last error: {last_error}")
 
-def create_tables():
-    """Creates necessary tables if they do not exist."""
-    table_schemas = {
-        "temperature": """
-            CREATE TABLE IF NOT EXISTS temperature (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                timestamp DATETIME,
-                value FLOAT,
-                unit VARCHAR(50) DEFAULT 'Celsius'
-            )
-        """,
-        "light": """
-            CREATE TABLE IF NOT EXISTS light (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                timestamp DATETIME,
-                value FLOAT,
-                unit VARCHAR(50) DEFAULT 'Lux'
-            )
-        """,
-        "humidity": """
-            CREATE TABLE IF NOT EXISTS humidity (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                timestamp DATETIME,
-                value FLOAT,
-                unit VARCHAR(50) DEFAULT 'Percentage'
-            )
-        """,
-        "wardrobe_items": """
-            CREATE TABLE IF NOT EXISTS wardrobe_items (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                user_id INT NOT NULL,
-                item_name VARCHAR(255) NOT NULL,
-                category VARCHAR(100),
-                image_url VARCHAR(512),
-                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-            )
-            
-        """,
-        "devices": """
-            CREATE TABLE IF NOT EXISTS devices (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                timestamp DATETIME,
-                value FLOAT,
-                unit VARCHAR(50) DEFAULT 'Percentage'
-            )
-        """,
-        "users": """
-            CREATE TABLE IF NOT EXISTS users (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                username VARCHAR(255) NOT NULL UNIQUE,
-                password VARCHAR(255) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """,
-        "sessions": """
-            CREATE TABLE IF NOT EXISTS sessions (
-                id VARCHAR(36) PRIMARY KEY,
-                user_id INT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-            )
-        """
-    }
-    connection = get_db_connection()
-    cursor = connection.cursor()
+class PooledConnection:
+    """
+    Wrapper around a pooled connection.
+
+    Behaves like the underlying MySQL connection, except that close() hands the
+    connection back to the pool instead of tearing down the TLS session.
+    """
+
+    def __init__(self, pool: "ConnectionPool", connection: mysql.MySQLConnection):
+        self._pool = pool
+        self._connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def is_connected(self) -> bool:
+        # Liveness is checked by the pool; avoid a ping round trip per query
+        return self._connection is not None
+
+    def close(self):
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self._pool.release(connection)
+
+    def discard(self):
+        """Close the physical connection instead of returning it, e.g. with unread results pending."""
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self._pool.discard(connection)
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of MySQL connections.
+
+    Connections are health-checked when they are handed out if they have been
+    idle for longer than `health_check_interval` seconds. Callers wait up to
+    `acquire_timeout` seconds for a free connection once `max_size` is reached.
+
+    `connect` opens a connection. fill() calls it without arguments, so it may
+    retry while the database starts up; acquire() calls it with max_retries=1
+    and a connection_timeout covering what is left of the acquire timeout, so
+    an outage fails requests within that time.
+    """
+
+    def __init__(self, min_size: int = 1, max_size: int = 10, acquire_timeout: float = 10.0,
+                 health_check_interval: float = 30.0, connect=_open_connection):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min={min_size}, max={max_size}")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+        self._connect = connect
+        self._idle = deque()  # (connection, last_used) pairs
+        self._size = 0
+        self._lock = threading.Condition()
+        self._stats = {
+            "acquired": 0,
+            "released": 0,
+            "created": 0,
+            "discarded": 0,
+            "timeouts": 0,
+            "health_check_failures": 0,
+        }
+
+    def fill(self):
+        """Open connections until the pool holds at least `min_size` of them."""
+        while True:
+            with self._lock:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                connection = self._connect()
+            except Exception:
+                with self._lock:
+                    self._size -= 1
+                    self._lock.notify()
+                raise
+            with self._lock:
+                self._stats["created"] += 1
+                self._idle.append((connection, time.monotonic()))
+                self._lock.notify()
+
+    def acquire(self, timeout: Optional[float] = None) -> PooledConnection:
+        """Check out a healthy connection, opening a new one if the pool is not full."""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise DatabaseConnectionError(
+                            f"Timed out after {timeout}s waiting for a database connection "
+                            f"(pool size {self.max_size})"
+                        )
+                    self._lock.wait(remaining)
+                if self._idle:
+                    connection, last_used = self._idle.pop()
+                else:
+                    connection, last_used = None, None
+                    self._size += 1
+
+            if connection is None:
+                try:
+                    # One attempt, bounded by the acquire deadline (the driver takes whole seconds)
+                    remaining = max(1, math.ceil(deadline - time.monotonic()))
+                    connection = self._connect(max_retries=1, connection_timeout=remaining)
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                        self._lock.notify()
+                    raise
+                with self._lock:
+                    self._stats["created"] += 1
+            elif not self._is_healthy(connection, last_used):
+                self.discard(connection)
+                continue
+
+            with self._lock:
+                self._stats["acquired"] += 1
+            return PooledConnection(self, connection)
+
+    def release(self, connection: mysql.MySQLConnection):
+        """Return a connection to the pool, discarding it if it is broken."""
+        try:
+            # Never hand out a connection with an open transaction
+            if connection.in_transaction:
+                connection.rollback()
+        except Exception:
+            self.discard(connection)
+            return
+        with self._lock:
+            self._stats["released"] += 1
+            self._idle.append((connection, time.monotonic()))
+            self._lock.notify()
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+            self._size -= len(idle)
+            self._lock.notify_all()
+        for connection, _ in idle:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def stats(self) -> Dict:
+        """Return a snapshot of the pool statistics."""
+        with self._lock:
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                **self._stats,
+            }
+
+    def _is_healthy(self, connection: mysql.MySQLConnection, last_used: float) -> bool:
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except Exception as err:
+            logger.warning(f"Discarding unhealthy pooled connection: {err}")
+            with self._lock:
+                self._stats["health_check_failures"] += 1
+            return False
+
+    def discard(self, connection: mysql.MySQLConnection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._size -= 1
+            self._stats["discarded"] += 1
+            self._lock.notify()
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """Return the shared connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    min_size=int(os.environ.get("MYSQL_POOL_MIN_SIZE", 2)),
+                    max_size=int(os.environ.get("MYSQL_POOL_MAX_SIZE", 10)),
+                    acquire_timeout=float(os.environ.get("MYSQL_POOL_TIMEOUT", 10)),
+                    health_check_interval=float(os.environ.get("MYSQL_POOL_HEALTH_CHECK_INTERVAL", 30)),
+                )
+                _pool.fill()
+    return _pool
+
+def get_pool_stats() -> Dict:
+    """Return statistics for the shared connection pool."""
+    if _pool is None:
+        return {"initialized": False}
+    return {"initialized": True, **_pool.stats()}
+
+def close_pool():
+    """Stop the database executor and close all idle pooled connections (used on application shutdown)."""
+    global _pool, _replica_pool, _executor
+    executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+        if _replica_pool is not None:
+            _replica_pool.close()
+            _replica_pool = None
+
+# Read replica. Set MYSQL_REPLICA_HOST to send reads that tolerate a little
+# staleness to a replica; other MYSQL_REPLICA_* settings default to the primary's.
+REPLICA_MAX_LAG = float(os.environ.get("MYSQL_REPLICA_MAX_LAG", 5))
+REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get("MYSQL_REPLICA_LAG_CHECK_INTERVAL", 5))
+
+_replica_pool: Optional[ConnectionPool] = None
+_replica_state = {
+    "lag": None,
+    "checked_at": None,
+    "replica_reads": 0,
+    "primary_reads": 0,
+    "fallbacks": 0,
+}
+
+def replica_configured() -> bool:
+    return bool(os.environ.get("MYSQL_REPLICA_HOST"))
+
+def get_replica_pool() -> ConnectionPool:
+    """Return the read replica connection pool, creating it on first use."""
+    global _replica_pool
+    if _replica_pool is None:
+        with _pool_lock:
+            if _replica_pool is None:
+                _replica_pool = ConnectionPool(
+                    min_size=int(os.environ.get("MYSQL_REPLICA_POOL_MIN_SIZE", 0)),
+                    max_size=int(os.environ.get("MYSQL_REPLICA_POOL_MAX_SIZE", os.environ.get("MYSQL_POOL_MAX_SIZE", 10))),
+                    acquire_timeout=float(os.environ.get("MYSQL_POOL_TIMEOUT", 10)),
+                    health_check_interval=float(os.environ.get("MYSQL_POOL_HEALTH_CHECK_INTERVAL", 30)),
+                    connect=functools.partial(_open_connection, max_retries=1, prefix="MYSQL_REPLICA", read_only=True),
+                )
+    return _replica_pool
+
+def _replica_lag(connection) -> Optional[float]:
+    """Seconds the replica is behind its source, or None if replication is not running."""
+    cursor = connection.cursor(dictionary=True, buffered=True)
     try:
-        for table_name, create_query in table_schemas.items():
-            cursor.execute(create_query)
-        connection.commit()
-        logger.info("Tables created successfully.")
-    except mysql.Error as err:
-        logger.error(f"Error creating tables: {err}")
+        try:
+            cursor.execute("SHOW REPLICA STATUS")
+        except Error:
+            # MySQL before 8.0.22 only knows the old name
+            cursor.execute("SHOW SLAVE STATUS")
+        status = cursor.fetchone()
     finally:
         cursor.close()
-        connection.close()
+    if not status:
+        return None
+    lag = status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+    return None if lag is None else float(lag)
 
-async def setup_database(initial_users: Dict[str, str] = None):
-    """Creates user and session tables and populates initial user data if provided."""
+def get_read_connection(consistent: bool = False) -> PooledConnection:
+    """
+    Check out a connection for a read-only query.
+
+    Reads go to the replica when one is configured and it is no more than
+    MYSQL_REPLICA_MAX_LAG seconds behind (checked at most every
+    MYSQL_REPLICA_LAG_CHECK_INTERVAL seconds). Consistent reads, e.g. right
+    after the caller wrote, and reads while the replica is lagging, down or
+    not replicating use the primary.
+    """
+    if consistent or not replica_configured():
+        _replica_state["primary_reads"] += 1
+        return get_db_connection()
     connection = None
-    cursor = None
+    try:
+        connection = get_replica_pool().acquire()
+        checked_at = _replica_state["checked_at"]
+        if checked_at is None or time.monotonic() - checked_at >= REPLICA_LAG_CHECK_INTERVAL:
+            _replica_state["lag"] = _replica_lag(connection)
+            _replica_state["checked_at"] = time.monotonic()
+        lag = _replica_state["lag"]
+        if lag is not None and lag <= REPLICA_MAX_LAG:
+            _replica_state["replica_reads"] += 1
+            return connection
+        connection.close()
+    except Exception as err:
+        logger.warning(f"Read replica unavailable, using the primary: {err}")
+        if connection is not None:
+            connection.discard()
+        # Check the replica again on the next read after the interval
+        _replica_state["lag"] = None
+        _replica_state["checked_at"] = time.monotonic()
+    _replica_state["fallbacks"] += 1
+    return get_db_connection()
+
+def get_replica_stats() -> Dict:
+    """Return read routing counters, the last measured replica lag and the replica pool statistics."""
+    if not replica_configured():
+        return {"configured": False}
+    checked_at = _replica_state["checked_at"]
+    return {
+        "configured": True,
+        "max_lag": REPLICA_MAX_LAG,
+        "lag": _replica_state["lag"],
+        "lag_checked_seconds_ago": time.monotonic() - checked_at if checked_at is not None else None,
+        "replica_reads": _replica_state["replica_reads"],
+        "primary_reads": _replica_state["primary_reads"],
+        "fallbacks": _replica_state["fallbacks"],
+        "pool": _replica_pool.stats() if _replica_pool else None,
+    }
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Return the executor that runs blocking database calls.
+
+    It has as many threads as the primary pool has connections, so calls that
+    check out and return a connection within one executor call rarely wait
+    on the pool. Connections held across calls (streaming cursors, or the
+    replica pool when it is smaller) are not counted against the threads, so
+    a thread can still block on acquire for up to MYSQL_POOL_TIMEOUT seconds.
+    """
+    global _executor
+    if _executor is None:
+        with _pool_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(os.environ.get("MYSQL_POOL_MAX_SIZE", 10)),
+                    thread_name_prefix="db",
+                )
+    return _executor
 
+def run_in_executor(func):
+    """Turn a blocking database function into a coroutine run on the database executor."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+    return wrapper
+
+async def iterate_in_executor(iterator):
+    """
+    Consume a blocking iterator from async code, one item per executor call.
+
+    The iterator is closed on the executor if the consumer stops early, so a
+    generator can release its connection in a finally block.
+    """
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    done = object()
     try:
-        # Get database connection
-        connection = get_db_connection()
-        cursor = connection.cursor()
+        while True:
+            item = await loop.run_in_executor(executor, next, iterator, done)
+            if item is done:
+                break
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close:
+            await loop.run_in_executor(executor, close)
 
-        # Drop and recreate tables one by one
-        for table_name in ["wardrobe_items","iot_devices", "sessions", "users"]:
-            # Drop table if exists
-            logger.info(f"Dropping table {table_name} if exists...")
-            cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
-            connection.commit()
-
-        # Recreate users and sessions tables
-        users_query = """
-            CREATE TABLE users (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                username VARCHAR(255) NOT NULL UNIQUE,
-                password VARCHAR(255) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """
-        sessions_query = """
-            CREATE TABLE sessions (
-                id VARCHAR(36) PRIMARY KEY,
-                user_id INT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-            )
-        """
-        iot_devices_query = """
-            CREATE TABLE iot_devices (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                device_id VARCHAR(255) NOT NULL,
-                user_id INT NOT NULL,
-                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-            )
-        """
-
-        wardrobe_items_query = """
-            CREATE TABLE IF NOT EXISTS wardrobe_items (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                user_id INT NOT NULL,
-                item_name VARCHAR(255) NOT NULL,
-                category VARCHAR(100),
-                image_url VARCHAR(512),
-                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-            )
-        """
-
-        # Create tables
-        for table_name, create_query in [
-            ("users", users_query), 
-            ("sessions", sessions_query),
-            ("iot_devices", iot_devices_query),
-            ("wardrobe_items", wardrobe_items_query)
-        ]:
-            try:
-                logger.info(f"Creating table {table_name}...")
-                cursor.execute(create_query)
-                connection.commit()
-                logger.info(f"Table {table_name} created successfully")
-            except Error as e:
-                logger.error(f"Error creating table {table_name}: {e}")
-                raise
+def get_db_connection() -> PooledConnection:
+    """Check out a connection from the shared pool. Call close() to return it."""
+    return get_pool().acquire()
 
-        # Insert initial users if provided
-        if initial_users:
-            try:
-                insert_query = "INSERT INTO users (username, password) VALUES (%s, %s)"
-                for username, password in initial_users.items():
-                    cursor.execute(insert_query, (username, password))
-                connection.commit()
-                logger.info(f"Inserted {len(initial_users)} initial users")
-            except Error as e:
-                logger.error(f"Error inserting initial users: {e}")
-                raise
+@run_in_executor
+def setup_database(initial_users: Dict[str, str] = None):
+    """Applies pending schema migrations and inserts initial user data if provided."""
+    from app.migrations import migrate
 
-    except Exception as e:
-        logger.error(f"Database setup failed: {e}")
-        raise
+    migrate()
 
+    if not initial_users:
+        return
+    connection = None
+    cursor = None
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        # INSERT IGNORE keeps existing users (and their data) across restarts
+        cursor.executemany(
+            "INSERT IGNORE INTO users (username, password) VALUES (%s, %s)",
+            list(initial_users.items())
+        )
+        connection.commit()
+        logger.info(f"Inserted {cursor.rowcount} initial users")
+    except Error as e:
+        logger.error(f"Error inserting initial users: {e}")
+        raise
     finally:
         if cursor:
             cursor.close()
         if connection and connection.is_connected():
             connection.close()
-            logger.info("Database connection closed")
-
-def populate_database():
-    """Initializes the database by creating tables."""
-    create_tables()
-    logger.info("Database populated.")
 
 # Database utility functions for user and session management
-async def create_user(username: str, password: str) -> Optional[int]:
+@run_in_executor
+def create_user(username: str, password: str) -> Optional[int]:
     """
     Create a new user in the database.
     
@@ -243,15 +499,10 @@ async def create_user(username: str, password: str) -> Optional[int]:
     connection = None
     cursor = None
     try:
-        # Check if username already exists
-        existing_user = await get_user_by_username(username)
-        if existing_user:
-            return None
-            
         connection = get_db_connection()
         cursor = connection.cursor()
         
-        # Insert the new user
+        # Insert the new user; the UNIQUE constraint rejects existing usernames
         cursor.execute(
             "INSERT INTO users (username, password) VALUES (%s, %s)", 
             (username, password)
@@ -261,6 +512,10 @@ async def create_user(username: str, password: str) -> Optional[int]:
         # Return the new user's ID
         user_id = cursor.lastrowid
         return user_id
+    except mysql.IntegrityError:
+        if connection:
+            connection.rollback()
+        return None
     except Exception as e:
         logger.error(f"Error creating user: {e}")
         if connection:
@@ -272,7 +527,8 @@ async def create_user(username: str, password: str) -> Optional[int]:
         if connection and connection.is_connected():
             connection.close()
 
-async def get_user_by_username(username: str) -> Optional[Dict]:
+@run_in_executor
+def get_user_by_username(username: str) -> Optional[Dict]:
     """Retrieve user from database by username."""
     connection = None
     cursor = None
@@ -287,7 +543,8 @@ async def get_user_by_username(username: str) -> Optional[Dict]:
         if connection and connection.is_connected():
             connection.close()
 
-async def get_user_by_id(user_id: int) -> Optional[Dict]:
+@run_in_executor
+def get_user_by_id(user_id: int) -> Optional[Dict]:
     """
     Retrieve user from database by ID.
 
@@ -310,7 +567,8 @@ async def get_user_by_id(user_id: int) -> Optional[Dict]:
         if connection and connection.is_connected():
             connection.close()
 
-async def create_session(user_id: int, session_id: str) -> bool:
+@run_in_executor
+def create_session(user_id: int, session_id: str) -> bool:
     """Create a new session in the database."""
     connection = None
     cursor = None
@@ -328,8 +586,16 @@ async def create_session(user_id: int, session_id: str) -> bool:
         if connection and connection.is_connected():
             connection.close()
 
-async def get_session(session_id: str) -> Optional[Dict]:
-    """Retrieve session from database."""
+@run_in_executor
+def get_session(session_id: str) -> Optional[Dict]:
+    """
+    Retrieve session from database.
+
+    Returns:
+        Optional[Dict]: The session ID, user_id, username, the set of
+        device_ids owned by the user and the session's age in seconds, or
+        None if the session does not exist
+    """
     connection = None
     cursor = None
     try:
@@ -337,21 +603,33 @@ async def get_session(session_id: str) -> Optional[Dict]:
         cursor = connection.cursor(dictionary=True)
         cursor.execute(
             """
-            SELECT s.id, u.username
+            SELECT s.id, u.id AS user_id, u.username, d.device_id,
+                   TIMESTAMPDIFF(SECOND, s.created_at, NOW()) AS age
             FROM sessions s
             JOIN users u ON s.user_id = u.id
+            LEFT JOIN iot_devices d ON d.user_id = u.id
             WHERE s.id = %s
         """,
             (session_id,),
         )
-        return cursor.fetchone()
+        rows = cursor.fetchall()
+        if not rows:
+            return None
+        return {
+            "id": rows[0]["id"],
+            "user_id": rows[0]["user_id"],
+            "username": rows[0]["username"],
+            "device_ids": {row["device_id"] for row in rows if row["device_id"] is not None},
+            "age": rows[0]["age"],
+        }
     finally:
         if cursor:
             cursor.close()
         if connection and connection.is_connected():
             connection.close()
 
-async def delete_session(session_id: str) -> bool:
+@run_in_executor
+def delete_session(session_id: str) -> bool:
     """Delete a session from the database."""
     connection = None
     cursor = None
@@ -367,36 +645,8 @@ async def delete_session(session_id: str) -> bool:
         if connection and connection.is_connected():
             connection.close()
 
-async def create_iot_devices_table():
-    """Create the IoT devices table if it doesn't exist."""
-    connection = None
-    cursor = None
-    try:
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        
-        # Create IoT devices table (removed device_type)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS iot_devices (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                device_id VARCHAR(255) NOT NULL,
-                user_id INT NOT NULL,
-                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-            )
-        """)
-        connection.commit()
-        logger.info("IoT devices table created successfully")
-    except Error as e:
-        logger.error(f"Error creating IoT devices table: {e}")
-        raise
-    finally:
-        if cursor:
-            cursor.close()
-        if connection and connection.is_connected():
-            connection.close()
-
-async def get_devices() -> list:
+@run_in_executor
+def get_devices() -> list:
     """
     Get all devices registered.
     
@@ -418,7 +668,8 @@ async def get_devices() -> list:
         if connection and connection.is_connected():
             connection.close()
 
-async def add_device(device_id: str, user_id:int) -> bool:
+@run_in_executor
+def add_device(device_id: str, user_id:int) -> bool:
     """
     Add a new device.
     
@@ -450,11 +701,12 @@ async def add_device(device_id: str, user_id:int) -> bool:
         if connection and connection.is_connected():
             connection.close()
 
-async def get_devices_by_user_id(user_id: int) -> list:
+@run_in_executor
+def get_devices_by_user_id(user_id: int, consistent: bool = False) -> list:
     connection = None
     cursor = None
     try:
-        connection = get_db_connection()
+        connection = get_read_connection(consistent)
         cursor = connection.cursor(dictionary=True)
         cursor.execute(
             "SELECT * FROM iot_devices WHERE user_id = %s ORDER BY added_at DESC",
@@ -478,7 +730,8 @@ async def get_devices_by_user_id(user_id: int) -> list:
         if connection and connection.is_connected():
             connection.close()
 
-async def get_devices_by_device_id(device_id: str) -> list:
+@run_in_executor
+def get_devices_by_device_id(device_id: str) -> list:
     """
     Get devices matching a specific device_id.
     
@@ -504,7 +757,8 @@ async def get_devices_by_device_id(device_id: str) -> list:
         if connection and connection.is_connected():
             connection.close()
 
-async def delete_device(device_id: str, user_id: int) -> bool:
+@run_in_executor
+def delete_device(device_id: str, user_id: int) -> bool:
 
     """
     Delete a device.
@@ -537,7 +791,8 @@ async def delete_device(device_id: str, user_id: int) -> bool:
         if connection and connection.is_connected():
             connection.close()
 
-async def get_devices() -> list:
+@run_in_executor
+def get_devices() -> list:
     """
     Get all devices registered.
     
@@ -559,7 +814,8 @@ async def get_devices() -> list:
         if connection and connection.is_connected():
             connection.close()
 
-async def add_wardrobe_item(user_id: int, item_name: str, category: str = None, image_url: str = None) -> int:
+@run_in_executor
+def add_wardrobe_item(user_id: int, item_name: str, category: str = None, image_url: str = None) -> int:
     """Add a new wardrobe item for a specific user"""
     connection = None
     cursor = None
@@ -583,12 +839,13 @@ async def add_wardrobe_item(user_id: int, item_name: str, category: str = None,
         if connection and connection.is_connected():
             connection.close()
 
-async def get_wardrobe_items_by_user_id(user_id: int) -> list:
-    """Get all wardrobe items for a specific user"""
+@run_in_executor
+def get_wardrobe_items_by_user_id(user_id: int, consistent: bool = False) -> list:
+    """Get all wardrobe items for a specific user (from the primary if consistent, else possibly a replica)"""
     connection = None
     cursor = None
     try:
-        connection = get_db_connection()
+        connection = get_read_connection(consistent)
         cursor = connection.cursor(dictionary=True)
         cursor.execute(
             "SELECT * FROM wardrobe_items WHERE user_id = %s ORDER BY added_at DESC",
@@ -612,7 +869,8 @@ async def get_wardrobe_items_by_user_id(user_id: int) -> list:
         if connection and connection.is_connected():
             connection.close()
 
-async def delete_wardrobe_item(item_id: int, user_id: int) -> bool:
+@run_in_executor
+def delete_wardrobe_item(item_id: int, user_id: int) -> bool:
     """Delete a wardrobe item (ensuring it belongs to the specified user)"""
     connection = None
     cursor = None
@@ -634,4 +892,492 @@ async def delete_wardrobe_item(item_id: int, user_id: int) -> bool:
         if cursor:
             cursor.close()
         if connection and connection.is_connected():
-            connection.close()
\ No newline at end of file
+            connection.close()
+
+# Sensor readings
+SENSOR_TYPES = ("temperature", "humidity", "light")
+
+# Raw reading layout: "tables" keeps one table per sensor type, "partitioned"
+# stores every type in READINGS_TABLE, range-partitioned by day (see app/partitions.py)
+SENSOR_STORAGE = os.getenv("SENSOR_STORAGE", "tables")
+if SENSOR_STORAGE not in ("tables", "partitioned"):
+    raise ValueError(f"Invalid SENSOR_STORAGE: {SENSOR_STORAGE}")
+READINGS_TABLE = "sensor_readings"
+
+def sensor_source(sensor_type: str) -> Tuple[str, list, list]:
+    """Return the table holding a sensor type's raw readings, with the WHERE clauses and parameters selecting them."""
+    if SENSOR_STORAGE == "partitioned":
+        return READINGS_TABLE, ["sensor_type = %s"], [sensor_type]
+    return sensor_type, [], []
+
+def _insert_statement(sensor_type: str) -> Tuple[str, tuple]:
+    """Return the INSERT for a sensor type's readings and the values to put before each row."""
+    if SENSOR_STORAGE == "partitioned":
+        return (
+            f"INSERT INTO {READINGS_TABLE} (sensor_type, device_id, timestamp, value, unit) VALUES (%s, %s, %s, %s, %s)",
+            (sensor_type,)
+        )
+    return f"INSERT INTO {sensor_type} (device_id, timestamp, value, unit) VALUES (%s, %s, %s, %s)", ()
+
+# Rows per multi-row INSERT statement, keeps statements well below max_allowed_packet
+INSERT_CHUNK_SIZE = 1000
+
+# Rollup tables ({sensor_type}_rollup_{name}) keep count/sum/min/max per device and bucket
+ROLLUP_RESOLUTIONS = {"minute": 60, "hour": 3600, "day": 86400}
+ROLLUP_AGGREGATES = {
+    "avg": "SUM(value_sum) / SUM(reading_count)",
+    "min": "MIN(value_min)",
+    "max": "MAX(value_max)",
+    "count": "SUM(reading_count)",
+}
+EPOCH = datetime(1970, 1, 1)
+
+def rollup_table(sensor_type: str, resolution: str) -> str:
+    return f"{sensor_type}_rollup_{resolution}"
+
+def bucket_start(timestamp, seconds: int) -> datetime:
+    """Start of the epoch-aligned bucket of the given width containing timestamp."""
+    if isinstance(timestamp, str):
+        timestamp = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
+    offset = int((timestamp - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=offset - offset % seconds)
+
+def _update_rollups(cursor, sensor_type: str, rows: list):
+    """
+    Fold (device_id, timestamp, value, unit) rows into the rollup tables.
+
+    Rows are pre-aggregated per device and bucket, then merged with one
+    multi-row upsert per resolution. Keys are sorted so that concurrent
+    transactions lock rollup rows in the same order.
+    """
+    for resolution, seconds in ROLLUP_RESOLUTIONS.items():
+        buckets: Dict[tuple, list] = {}
+        for device_id, timestamp, value, _ in rows:
+            key = (device_id, bucket_start(timestamp, seconds))
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = [1, value, value, value]
+            else:
+                bucket[0] += 1
+                bucket[1] += value
+                bucket[2] = min(bucket[2], value)
+                bucket[3] = max(bucket[3], value)
+        query = (
+            f"INSERT INTO {rollup_table(sensor_type, resolution)} "
+            "(device_id, bucket_start, reading_count, value_sum, value_min, value_max) "
+            "VALUES (%s, %s, %s, %s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE "
+            "reading_count = reading_count + VALUES(reading_count), "
+            "value_sum = value_sum + VALUES(value_sum), "
+            "value_min = LEAST(value_min, VALUES(value_min)), "
+            "value_max = GREATEST(value_max, VALUES(value_max))"
+        )
+        values = [(*key, *bucket) for key, bucket in sorted(buckets.items())]
+        for start in range(0, len(values), INSERT_CHUNK_SIZE):
+            cursor.executemany(query, values[start:start + INSERT_CHUNK_SIZE])
+
+def _choose_rollup(bucket_seconds: int, aggregates: list, start_date: datetime = None,
+                   end_date: datetime = None) -> Optional[str]:
+    """
+    Pick the coarsest rollup that answers a bucketed query exactly, or None.
+
+    The rollup resolution must divide the bucket width, and the requested range
+    must cover whole rollup buckets (start aligned, end just before a boundary).
+    """
+    if not set(aggregates) <= set(ROLLUP_AGGREGATES):
+        return None
+    for resolution, seconds in sorted(ROLLUP_RESOLUTIONS.items(), key=lambda item: -item[1]):
+        if bucket_seconds % seconds:
+            continue
+        if start_date and bucket_start(start_date, seconds) != start_date:
+            continue
+        if end_date and bucket_start(end_date + timedelta(seconds=1), seconds) != end_date + timedelta(seconds=1):
+            continue
+        return resolution
+    return None
+
+SENSOR_COLUMNS = ("id", "device_id", "timestamp", "value", "unit")
+
+@run_in_executor
+def get_sensor_readings(sensor_type: str, device_id: str = None, order_by: str = None,
+                        start_date: datetime = None, end_date: datetime = None,
+                        limit: int = None, after: tuple = None) -> list:
+    """
+    Get a page of readings for a sensor type with optional filtering.
+
+    Pages use keyset pagination: `after` is the (sort value, id) of the last
+    row of the previous page, so every page costs the same as the first.
+    Reads go to the read replica when one is configured and caught up.
+
+    Args:
+        sensor_type: One of the sensor tables (temperature, humidity, light)
+        device_id: Only return readings from this device
+        order_by: "value" (ascending) or "timestamp" (newest first, the default)
+        start_date: Only return readings at or after this time
+        end_date: Only return readings at or before this time
+        limit: Maximum number of rows to return
+        after: Keyset of the last row already returned
+
+    Returns:
+        list: List of reading rows
+    """
+    table, where_clauses, parameters = sensor_source(sensor_type)
+    query = f"SELECT {', '.join(SENSOR_COLUMNS)} FROM {table}"
+
+    if device_id:
+        where_clauses.append("device_id = %s")
+        parameters.append(device_id)
+    if start_date:
+        where_clauses.append("timestamp >= %s")
+        parameters.append(start_date)
+    if end_date:
+        where_clauses.append("timestamp <= %s")
+        parameters.append(end_date)
+
+    # The id tie-breaker makes the sort order total, so keysets never skip or repeat rows
+    if order_by == "value":
+        if after:
+            # FLOAT column: compare at single precision so equal values match exactly
+            where_clauses.append("(value > CAST(%s AS FLOAT) OR (value = CAST(%s AS FLOAT) AND id > %s))")
+            parameters.extend([after[0], after[0], after[1]])
+        order_clause = " ORDER BY value, id"
+    else:
+        if after:
+            where_clauses.append("(timestamp < %s OR (timestamp = %s AND id < %s))")
+            parameters.extend([after[0], after[0], after[1]])
+        order_clause = " ORDER BY timestamp DESC, id DESC"
+
+    if where_clauses:
+        query += " WHERE " + " AND ".join(where_clauses)
+    query += order_clause
+    if limit:
+        query += " LIMIT %s"
+        parameters.append(limit)
+
+    connection = None
+    cursor = None
+    try:
+        connection = get_read_connection()
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(query, tuple(parameters))
+        return cursor.fetchall()
+    finally:
+        if cursor:
+            cursor.close()
+        if connection and connection.is_connected():
+            connection.close()
+
+def iter_sensor_readings(sensor_type: str, device_id: str = None, order_by: str = None,
+                         start_date: datetime = None, end_date: datetime = None, chunk_size: int = 5000):
+    """
+    Yield readings for a sensor type in chunks of tuples (see SENSOR_COLUMNS).
+
+    device_id may also be a list of ids, e.g. all of a user's devices; an
+    empty list yields nothing. Rows are read from an unbuffered server-side
+    cursor with fetchmany(), so memory use stays flat however large the range
+    is. Run it on the database executor, e.g. through iterate_in_executor().
+    """
+    table, where_clauses, parameters = sensor_source(sensor_type)
+    query = f"SELECT {', '.join(SENSOR_COLUMNS)} FROM {table}"
+
+    if isinstance(device_id, (list, tuple)):
+        if not device_id:
+            return
+        where_clauses.append(f"device_id IN ({', '.join(['%s'] * len(device_id))})")
+        parameters.extend(device_id)
+    elif device_id:
+        where_clauses.append("device_id = %s")
+        parameters.append(device_id)
+    if start_date:
+        where_clauses.append("timestamp >= %s")
+        parameters.append(start_date)
+    if end_date:
+        where_clauses.append("timestamp <= %s")
+        parameters.append(end_date)
+
+    if where_clauses:
+        query += " WHERE " + " AND ".join(where_clauses)
+    query += " ORDER BY value, id" if order_by == "value" else " ORDER BY timestamp DESC, id DESC"
+
+    connection = get_read_connection()
+    cursor = connection.cursor(buffered=False)
+    finished = False
+    try:
+        cursor.execute(query, tuple(parameters))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+        finished = True
+    finally:
+        if finished:
+            cursor.close()
+            connection.close()
+        else:
+            # Unread rows are still pending on the wire; do not reuse this connection
+            connection.discard()
+
+@run_in_executor
+def get_sensor_summary(sensor_type: str, device_id: str, start_date: datetime = None,
+                       end_date: datetime = None) -> Dict:
+    """Get the number of readings, value range and time range of a device's readings."""
+    table, where_clauses, parameters = sensor_source(sensor_type)
+    where_clauses.append("device_id = %s")
+    parameters.append(device_id)
+    if start_date:
+        where_clauses.append("timestamp >= %s")
+        parameters.append(start_date)
+    if end_date:
+        where_clauses.append("timestamp <= %s")
+        parameters.append(end_date)
+
+    connection = None
+    cursor = None
+    try:
+        connection = get_read_connection()
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(
+            "SELECT COUNT(*) AS count, MIN(value) AS min, MAX(value) AS max, "
+            f"MIN(timestamp) AS first, MAX(timestamp) AS last FROM {table} WHERE {' AND '.join(where_clauses)}",
+            tuple(parameters)
+        )
+        return cursor.fetchone()
+    finally:
+        if cursor:
+            cursor.close()
+        if connection and connection.is_connected():
+            connection.close()
+
+# SQL for each supported aggregate; first/last pick the earliest/latest value in the bucket
+SENSOR_AGGREGATES = {
+    "avg": "AVG(value)",
+    "min": "MIN(value)",
+    "max": "MAX(value)",
+    "count": "COUNT(*)",
+    "first": "SUBSTRING_INDEX(GROUP_CONCAT(value ORDER BY timestamp, id), ',', 1) + 0",
+    "last": "SUBSTRING_INDEX(GROUP_CONCAT(value ORDER BY timestamp DESC, id DESC), ',', 1) + 0",
+}
+
+@run_in_executor
+def get_sensor_aggregates(sensor_type: str, bucket_seconds: int, aggregates: list, device_id: str = None,
+                          start_date: datetime = None, end_date: datetime = None,
+                          limit: int = None, before: datetime = None) -> list:
+    """
+    Get readings for a sensor type aggregated into fixed time buckets.
+
+    Args:
+        sensor_type: One of the sensor tables (temperature, humidity, light)
+        bucket_seconds: Bucket width in seconds; buckets are aligned to the epoch
+        aggregates: Names from SENSOR_AGGREGATES to compute per bucket
+        device_id: Only aggregate readings from this device
+        start_date: Only aggregate readings at or after this time
+        end_date: Only aggregate readings at or before this time
+        limit: Maximum number of buckets to return
+        before: Start of the last bucket already returned, for keyset pagination
+
+    Returns:
+        list: One row per bucket, newest first, with a "timestamp" column holding the bucket start
+
+    Queries that only need avg/min/max/count over whole rollup buckets are
+    answered from the minute/hour/day rollup tables instead of raw readings.
+    """
+    # Read from the coarsest rollup that can answer the query, else scan raw readings
+    resolution = _choose_rollup(bucket_seconds, aggregates, start_date, end_date)
+    if resolution:
+        table, time_column, expressions = rollup_table(sensor_type, resolution), "bucket_start", ROLLUP_AGGREGATES
+        where_clauses, source_parameters = [], []
+    else:
+        table, where_clauses, source_parameters = sensor_source(sensor_type)
+        time_column, expressions = "timestamp", SENSOR_AGGREGATES
+
+    bucket = (
+        "DATE_ADD('1970-01-01', INTERVAL "
+        f"(TIMESTAMPDIFF(SECOND, '1970-01-01', {time_column}) DIV %s) * %s SECOND)"
+    )
+    columns = ", ".join(f"{expressions[name]} AS `{name}`" for name in aggregates)
+    query = f"SELECT {bucket} AS bucket, {columns} FROM {table}"
+    parameters = [bucket_seconds, bucket_seconds, *source_parameters]
+
+    if device_id:
+        where_clauses.append("device_id = %s")
+        parameters.append(device_id)
+    if start_date:
+        where_clauses.append(f"{time_column} >= %s")
+        parameters.append(start_date)
+    if end_date:
+        where_clauses.append(f"{time_column} <= %s")
+        parameters.append(end_date)
+    if before:
+        # Buckets cover whole time ranges, so older buckets hold only older readings
+        where_clauses.append(f"{time_column} < %s")
+        parameters.append(before)
+
+    if where_clauses:
+        query += " WHERE " + " AND ".join(where_clauses)
+    query += " GROUP BY bucket ORDER BY bucket DESC"
+    if limit:
+        query += " LIMIT %s"
+        parameters.append(limit)
+
+    connection = None
+    cursor = None
+    try:
+        connection = get_read_connection()
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(query, tuple(parameters))
+        result = cursor.fetchall()
+        for row in result:
+            row["timestamp"] = row.pop("bucket")
+            for key, value in row.items():
+                if isinstance(value, decimal.Decimal):
+                    row[key] = float(value)
+        return result
+    finally:
+        if cursor:
+            cursor.close()
+        if connection and connection.is_connected():
+            connection.close()
+
+@run_in_executor
+def insert_sensor_reading(sensor_type: str, device_id: str, timestamp: str, value: float, unit: str) -> int:
+    """Insert a single sensor reading, update the rollups and return its ID."""
+    connection = None
+    cursor = None
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        query, prefix = _insert_statement(sensor_type)
+        cursor.execute(query, (*prefix, device_id, timestamp, value, unit))
+        new_id = cursor.lastrowid
+        _update_rollups(cursor, sensor_type, [(device_id, timestamp, value, unit)])
+        connection.commit()
+        return new_id
+    except Error:
+        if connection:
+            connection.rollback()
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+        if connection and connection.is_connected():
+            connection.close()
+
+@run_in_executor
+def get_latest_sensor_reading(sensor_type: str, device_id: str) -> Optional[Dict]:
+    """Get the most recent reading of a sensor type for a device."""
+    table, where_clauses, parameters = sensor_source(sensor_type)
+    where_clauses = where_clauses + ["device_id = %s"]
+    connection = None
+    cursor = None
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(
+            f"SELECT {', '.join(SENSOR_COLUMNS)} FROM {table} "
+            f"WHERE {' AND '.join(where_clauses)} ORDER BY timestamp DESC LIMIT 1",
+            (*parameters, device_id)
+        )
+        return cursor.fetchone()
+    finally:
+        if cursor:
+            cursor.close()
+        if connection and connection.is_connected():
+            connection.close()
+
+@run_in_executor
+def get_latest_sensor_readings(sensor_type: str) -> list:
+    """Get the most recent reading of a sensor type for every device."""
+    table, where_clauses, parameters = sensor_source(sensor_type)
+    where = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+    outer_where = f"WHERE {' AND '.join('t.' + clause for clause in where_clauses)}" if where_clauses else ""
+    connection = None
+    cursor = None
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor(dictionary=True)
+        # The (device_id, timestamp) index answers the per-device MAX without a scan
+        cursor.execute(f"""
+            SELECT {', '.join('t.' + column for column in SENSOR_COLUMNS)} FROM {table} t
+            JOIN (SELECT device_id, MAX(timestamp) AS latest FROM {table} {where} GROUP BY device_id) m
+              ON t.device_id = m.device_id AND t.timestamp = m.latest
+            {outer_where}
+            ORDER BY t.id
+        """, (*parameters, *parameters))
+        return cursor.fetchall()
+    finally:
+        if cursor:
+            cursor.close()
+        if connection and connection.is_connected():
+            connection.close()
+
+def write_sensor_readings(readings: list, update_rollups: bool = True) -> int:
+    """
+    Insert many sensor readings and update the rollups in a single transaction.
+
+    Args:
+        readings: List of (sensor_type, device_id, timestamp, value, unit) tuples
+        update_rollups: Fold the readings into the rollup tables; bulk loads
+            turn this off and rebuild the affected days afterwards instead
+
+    Returns:
+        int: Number of rows inserted
+    """
+    by_type: Dict[str, list] = {}
+    for sensor_type, device_id, timestamp, value, unit in readings:
+        by_type.setdefault(sensor_type, []).append((device_id, timestamp, value, unit))
+
+    connection = None
+    cursor = None
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        inserted = 0
+        for sensor_type, rows in by_type.items():
+            # executemany() rewrites a plain INSERT into one multi-row statement
+            query, prefix = _insert_statement(sensor_type)
+            for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+                chunk = rows[start:start + INSERT_CHUNK_SIZE]
+                cursor.executemany(query, [(*prefix, *row) for row in chunk] if prefix else chunk)
+                inserted += len(chunk)
+            if update_rollups:
+                _update_rollups(cursor, sensor_type, rows)
+        connection.commit()
+        return inserted
+    except Error:
+        if connection:
+            connection.rollback()
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+        if connection and connection.is_connected():
+            connection.close()
+
+insert_sensor_readings = run_in_executor(write_sensor_readings)
+
+@run_in_executor
+def get_device_owners(device_ids=None) -> list:
+    """Return (device_id, user_id) pairs for all registered devices, or only for device_ids."""
+    connection = None
+    cursor = None
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        if device_ids is None:
+            cursor.execute("SELECT device_id, user_id FROM iot_devices")
+        else:
+            device_ids = list(set(device_ids))
+            if not device_ids:
+                return []
+            placeholders = ", ".join(["%s"] * len(device_ids))
+            cursor.execute(
+                f"SELECT device_id, user_id FROM iot_devices WHERE device_id IN ({placeholders})",
+                tuple(device_ids)
+            )
+        return cursor.fetchall()
+    finally:
+        if cursor:
+            cursor.close()
+        if connection and connection.is_connected():
+            connection.close()
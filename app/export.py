@@ -0,0 +1,178 @@
+"""
+Columnar export of sensor readings.
+
+Readings are converted chunk by chunk as they arrive from the server-side
+cursor and streamed out as Parquet or Arrow IPC when pyarrow is installed.
+Without pyarrow the export falls back to a compressed NPZ archive. An .npy
+member needs its length in the header, so each column is spooled to a
+temporary file as it arrives and copied into the archive at the end.
+"""
+import io
+import tempfile
+import zipfile
+from typing import AsyncIterator, Dict, List
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+    pq = None
+
+EXPORT_MEDIA_TYPES = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "npz": "application/octet-stream",
+}
+
+# Rows per Parquet row group; larger groups compress better
+PARQUET_ROW_GROUP_SIZE = 100000
+
+# Bytes copied from a spooled NPZ column per streamed piece
+NPZ_COPY_SIZE = 1 << 20
+
+def export_formats() -> List[str]:
+    """Return the export formats supported by the installed libraries."""
+    return ["parquet", "arrow", "npz"] if pa is not None else ["npz"]
+
+
+class _ByteSink(io.RawIOBase):
+    """Write-only file object whose contents are collected and drained as bytes."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data, self._buffer = bytes(self._buffer), bytearray()
+        return data
+
+
+def _arrow_schema():
+    return pa.schema([
+        ("id", pa.int64()),
+        ("device_id", pa.string()),
+        ("timestamp", pa.timestamp("s")),
+        ("value", pa.float32()),
+        ("unit", pa.string()),
+    ])
+
+def _arrow_batch(rows: list, schema):
+    """Build a record batch from (id, device_id, timestamp, value, unit) rows."""
+    columns = list(zip(*rows))
+    return pa.record_batch(
+        [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+        schema=schema,
+    )
+
+async def _export_parquet(chunks: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    schema = _arrow_schema()
+    sink = _ByteSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    pending, pending_rows = [], 0
+    try:
+        async for rows in chunks:
+            pending.append(_arrow_batch(rows, schema))
+            pending_rows += len(rows)
+            if pending_rows >= PARQUET_ROW_GROUP_SIZE:
+                writer.write_table(pa.Table.from_batches(pending, schema))
+                pending, pending_rows = [], 0
+                yield sink.drain()
+        if pending:
+            writer.write_table(pa.Table.from_batches(pending, schema))
+    finally:
+        writer.close()
+    yield sink.drain()
+
+async def _export_arrow(chunks: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    schema = _arrow_schema()
+    sink = _ByteSink()
+    writer = pa.ipc.new_stream(sink, schema, options=pa.ipc.IpcWriteOptions(compression="zstd"))
+    try:
+        async for rows in chunks:
+            writer.write_batch(_arrow_batch(rows, schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+async def _export_npz(chunks: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    # Device IDs and units repeat, so store each as small integer codes plus a lookup table
+    dtypes = {
+        "id": np.dtype(np.int64),
+        "timestamp": np.dtype("datetime64[s]"),
+        "value": np.dtype(np.float32),
+        "device_code": np.dtype(np.int32),
+        "unit_code": np.dtype(np.int16),
+    }
+    spools = {name: tempfile.TemporaryFile() for name in dtypes}
+    devices: Dict[str, int] = {}
+    units: Dict[str, int] = {}
+    count = 0
+    try:
+        async for rows in chunks:
+            row_ids, row_devices, row_timestamps, row_values, row_units = zip(*rows)
+            columns = {
+                "id": row_ids,
+                "timestamp": row_timestamps,
+                "value": row_values,
+                "device_code": [devices.setdefault(d, len(devices)) for d in row_devices],
+                "unit_code": [units.setdefault(u, len(units)) for u in row_units],
+            }
+            for name, column in columns.items():
+                spools[name].write(np.array(column, dtype=dtypes[name]).tobytes())
+            count += len(rows)
+
+        sink = _ByteSink()
+        with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for name, spool in spools.items():
+                with archive.open(f"{name}.npy", "w", force_zip64=True) as member:
+                    np.lib.format.write_array_header_1_0(member, {
+                        "descr": np.lib.format.dtype_to_descr(dtypes[name]),
+                        "fortran_order": False,
+                        "shape": (count,),
+                    })
+                    spool.seek(0)
+                    while True:
+                        block = spool.read(NPZ_COPY_SIZE)
+                        if not block:
+                            break
+                        member.write(block)
+                        yield sink.drain()
+                yield sink.drain()
+            lookups = {"device_id": list(devices), "unit": list(units)}
+            for name, labels in lookups.items():
+                with archive.open(f"{name}.npy", "w", force_zip64=True) as member:
+                    np.lib.format.write_array(member, np.array(labels, dtype=str), allow_pickle=False)
+                yield sink.drain()
+        yield sink.drain()
+    finally:
+        for spool in spools.values():
+            spool.close()
+
+def export_readings(chunks: AsyncIterator[list], export_format: str) -> AsyncIterator[bytes]:
+    """
+    Encode chunks of (id, device_id, timestamp, value, unit) rows in export_format.
+
+    Returns an async iterator of encoded bytes, suitable for a StreamingResponse.
+    """
+    if export_format not in export_formats():
+        raise ValueError(f"Unsupported export format: {export_format}")
+    if export_format == "parquet":
+        return _export_parquet(chunks)
+    if export_format == "arrow":
+        return _export_arrow(chunks)
+    return _export_npz(chunks)
@@ -0,0 +1,200 @@
+"""
+Bulk import of historical sensor readings from CSV files.
+
+Files are streamed in chunks with pandas, so memory use does not depend on
+the file size. Each chunk is validated and converted column-wise, written
+with multi-row inserts in one transaction, and recorded in a checkpoint file
+next to the CSV; an interrupted import resumes after the last committed
+chunk. Rollups are rebuilt once for the imported days at the end instead of
+being updated row by row.
+
+CSV columns: timestamp, value and optionally unit and device_id. Missing
+unit/device_id columns are filled from --unit/--device-id, and the sensor
+type defaults to the file name (e.g. sample/temperature.csv).
+
+Usage:
+    python -m app.importer sample/temperature.csv [--sensor-type TYPE] [--device-id ID] [--unit UNIT]
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from itertools import repeat
+from typing import Callable, Dict, Optional
+
+import pandas as pd
+
+from mysql.connector import Error
+
+from app.database import DatabaseConnectionError, SENSOR_TYPES, get_db_connection, write_sensor_readings
+from app.rollups import backfill
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "50000"))
+
+
+class CSVImportError(Exception):
+    """Raised when a CSV file cannot be imported"""
+    pass
+
+
+def checkpoint_path(path: str) -> str:
+    return f"{path}.checkpoint"
+
+def _load_checkpoint(path: str) -> Dict:
+    """Return the saved progress for path, or a fresh one if the file changed since."""
+    stat = os.stat(path)
+    fresh = {"size": stat.st_size, "mtime": stat.st_mtime, "rows_read": 0,
+             "imported": 0, "rejected": 0, "first": None, "last": None, "rollup_error": None}
+    try:
+        with open(checkpoint_path(path)) as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return fresh
+    if checkpoint.get("size") != stat.st_size or checkpoint.get("mtime") != stat.st_mtime:
+        logger.info(f"{path} changed since the last import, starting over")
+        return fresh
+    return checkpoint
+
+def _save_checkpoint(path: str, checkpoint: Dict):
+    # Write then rename, so a crash never leaves a truncated checkpoint
+    temporary = checkpoint_path(path) + ".tmp"
+    with open(temporary, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(temporary, checkpoint_path(path))
+
+def _prepare_chunk(chunk: pd.DataFrame, device_id: Optional[str],
+                   unit: Optional[str], timestamp_format: Optional[str]) -> pd.DataFrame:
+    """Validate and convert a chunk column-wise, dropping rows with unusable values."""
+    frame = pd.DataFrame({
+        "timestamp": pd.to_datetime(chunk["timestamp"], format=timestamp_format, errors="coerce"),
+        "value": pd.to_numeric(chunk["value"], errors="coerce"),
+        "device_id": chunk["device_id"] if "device_id" in chunk else device_id,
+        "unit": chunk["unit"] if "unit" in chunk else unit,
+    })
+    frame = frame.dropna()
+    return frame[(frame["device_id"].astype(str) != "") & (frame["unit"].astype(str) != "")]
+
+def import_csv(path: str, sensor_type: str = None, device_id: str = None, unit: str = None,
+               timestamp_format: str = None, chunk_size: int = IMPORT_CHUNK_SIZE,
+               progress: Callable[[Dict], None] = None) -> Dict:
+    """
+    Import a CSV file of readings, resuming from its checkpoint if there is one.
+
+    Args:
+        path: CSV file to import
+        sensor_type: Sensor type of every row (defaults to the file name)
+        device_id: Device ID for files without a device_id column
+        unit: Unit for files without a unit column
+        timestamp_format: strftime format of the timestamp column (inferred by default)
+        chunk_size: Rows per chunk and per transaction
+        progress: Called with the progress dict after every committed chunk
+
+    Returns:
+        Dict: rows_read, imported and rejected counts, the imported time range and
+        rollup_error, set if the readings were stored but their rollups could not be rebuilt
+    """
+    sensor_type = sensor_type or os.path.splitext(os.path.basename(path))[0]
+    if sensor_type not in SENSOR_TYPES:
+        raise CSVImportError(f"Unknown sensor type {sensor_type!r}. Expected one of: {', '.join(SENSOR_TYPES)}")
+
+    checkpoint = _load_checkpoint(path)
+    if os.path.getsize(path) == 0:
+        logger.info(f"{path} is empty, nothing to import")
+        return checkpoint
+    header = pd.read_csv(path, nrows=0).columns
+    missing = [column for column in ("timestamp", "value") if column not in header]
+    if "device_id" not in header and not device_id:
+        missing.append("device_id (or --device-id)")
+    if "unit" not in header and not unit:
+        missing.append("unit (or --unit)")
+    if missing:
+        raise CSVImportError(f"{path} is missing columns: {', '.join(missing)}")
+
+    if checkpoint["rows_read"]:
+        logger.info(f"Resuming {path} after {checkpoint['rows_read']} rows")
+    started = time.monotonic()
+    imported_before = checkpoint["imported"]
+    rows_read = checkpoint["rows_read"]
+    chunks = pd.read_csv(
+        path,
+        chunksize=chunk_size,
+        # A callable, so resuming far into a file does not build a set of every skipped row
+        skiprows=lambda i: 0 < i <= rows_read,
+        dtype={"device_id": str, "unit": str},
+    )
+    for chunk in chunks:
+        frame = _prepare_chunk(chunk, device_id, unit, timestamp_format)
+        if len(frame):
+            timestamps = frame["timestamp"].dt.strftime("%Y-%m-%d %H:%M:%S")
+            rows = list(zip(repeat(sensor_type), frame["device_id"], timestamps, frame["value"], frame["unit"]))
+            write_sensor_readings(rows, update_rollups=False)
+            # ISO strings compare in time order
+            first, last = timestamps.min(), timestamps.max()
+            checkpoint["first"] = min(filter(None, (checkpoint["first"], first)))
+            checkpoint["last"] = max(filter(None, (checkpoint["last"], last)))
+
+        checkpoint["rows_read"] += len(chunk)
+        checkpoint["imported"] += len(frame)
+        checkpoint["rejected"] += len(chunk) - len(frame)
+        _save_checkpoint(path, checkpoint)
+
+        elapsed = time.monotonic() - started
+        status = {
+            **checkpoint,
+            "rows_per_second": (checkpoint["imported"] - imported_before) / elapsed if elapsed else 0.0,
+        }
+        if progress:
+            progress(status)
+        logger.info(
+            f"{path}: {status['imported']} imported, {status['rejected']} rejected "
+            f"({status['rows_per_second']:.0f} rows/s)"
+        )
+
+    checkpoint["rollup_error"] = None
+    if checkpoint["first"]:
+        # Rebuild the rollups of every day the import touched
+        try:
+            connection = get_db_connection()
+            try:
+                start = datetime.strptime(checkpoint["first"][:10], "%Y-%m-%d")
+                end = datetime.strptime(checkpoint["last"][:10], "%Y-%m-%d") + timedelta(days=1)
+                backfill(connection, [sensor_type], start, end)
+            finally:
+                connection.close()
+        except (Error, DatabaseConnectionError) as e:
+            # The readings are stored; keep the completed checkpoint so a re-run only retries the rebuild
+            checkpoint["rollup_error"] = str(e)
+            _save_checkpoint(path, checkpoint)
+            logger.error(
+                f"{path}: readings imported, but rebuilding the {sensor_type} rollups failed: {e}. "
+                f"Import the file again or run python -m app.rollups backfill --sensor-type {sensor_type} "
+                f"--start-date {checkpoint['first'][:10]} --end-date {checkpoint['last'][:10]}"
+            )
+            return checkpoint
+    if os.path.exists(checkpoint_path(path)):
+        os.remove(checkpoint_path(path))
+    return checkpoint
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import sensor readings from CSV files")
+    parser.add_argument("paths", nargs="+", help="CSV files, named after their sensor type unless --sensor-type is given")
+    parser.add_argument("--sensor-type", choices=SENSOR_TYPES, default=None)
+    parser.add_argument("--device-id", default=None, help="Device ID for files without a device_id column")
+    parser.add_argument("--unit", default=None, help="Unit for files without a unit column")
+    parser.add_argument("--timestamp-format", default=None, help="e.g. %%Y-%%m-%%d %%H:%%M:%%S (inferred by default)")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    for path in args.paths:
+        result = import_csv(path, args.sensor_type, args.device_id, args.unit,
+                            args.timestamp_format, args.chunk_size)
+        print(f"{path}: imported {result['imported']} rows, rejected {result['rejected']}")
+        if result.get("rollup_error"):
+            print(f"{path}: rollups not rebuilt: {result['rollup_error']}")
+
+if __name__ == "__main__":
+    main()
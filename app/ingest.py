@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ACK_ON_ENQUEUE = "enqueue"
+ACK_ON_COMMIT = "commit"
+
+
+class IngestQueueFull(Exception):
+    """Raised when the write-behind queue cannot take more readings"""
+    pass
+
+
+class IngestBuffer:
+    """
+    Write-behind buffer for sensor readings.
+
+    Readings are queued in memory and a background task writes them to the
+    database in group commits of up to `batch_size` rows, or whatever has
+    arrived after `flush_interval` seconds. With ack="enqueue" callers return
+    as soon as their readings are queued; with ack="commit" they wait for the
+    group commit that contains them.
+    """
+
+    def __init__(self, write: Callable[[list], Awaitable[int]], max_queue: int = 10000,
+                 batch_size: int = 500, flush_interval: float = 0.5, ack: str = ACK_ON_ENQUEUE,
+                 max_retries: int = 3):
+        if ack not in (ACK_ON_ENQUEUE, ACK_ON_COMMIT):
+            raise ValueError(f"Invalid ack mode: {ack}")
+        self._write = write
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.ack = ack
+        self.max_retries = max_retries
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            "enqueued": 0,
+            "written": 0,
+            "dropped": 0,
+            "rejected": 0,
+            "flushes": 0,
+            "flush_errors": 0,
+            "last_flush_rows": 0,
+            "last_flush_seconds": 0.0,
+            "max_flush_seconds": 0.0,
+            "total_flush_seconds": 0.0,
+        }
+
+    async def start(self):
+        """Start the background flush task."""
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Ingest buffer started (ack on {self.ack}, batch {self.batch_size}, interval {self.flush_interval}s)")
+
+    async def stop(self):
+        """Flush everything still queued and stop the background task."""
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        logger.info("Ingest buffer flushed and stopped")
+
+    async def submit(self, rows: list):
+        """
+        Queue readings for writing.
+
+        Raises IngestQueueFull if the queue has no room for all of them. With
+        ack="commit" this waits until the readings are committed and re-raises
+        the database error if the write fails.
+        """
+        if self._queue is None:
+            raise RuntimeError("Ingest buffer is not running")
+        if self.max_queue - self._queue.qsize() < len(rows):
+            self._stats["rejected"] += len(rows)
+            raise IngestQueueFull(f"Ingest queue is full ({self._queue.qsize()}/{self.max_queue} readings)")
+
+        future = asyncio.get_running_loop().create_future() if self.ack == ACK_ON_COMMIT else None
+        pending = [len(rows), future]
+        for row in rows:
+            self._queue.put_nowait((row, pending))
+        self._stats["enqueued"] += len(rows)
+        if future is not None:
+            await future
+
+    def stats(self) -> Dict:
+        """Return queue depth and flush latency metrics."""
+        flushes = self._stats["flushes"]
+        return {
+            "ack": self.ack,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_queue": self.max_queue,
+            "avg_flush_seconds": self._stats["total_flush_seconds"] / flushes if flushes else 0.0,
+            **self._stats,
+        }
+
+    async def _next_batch(self) -> List[tuple]:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch: List[tuple]):
+        rows = [row for row, _ in batch]
+        error = None
+        started = time.monotonic()
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                await self._write(rows)
+                error = None
+                break
+            except Exception as e:
+                error = e
+                self._stats["flush_errors"] += 1
+                logger.warning(f"Ingest flush of {len(rows)} readings failed (attempt {attempt}/{self.max_retries}): {e}")
+                if attempt < self.max_retries:
+                    await asyncio.sleep(0.1 * 2 ** attempt)
+        elapsed = time.monotonic() - started
+
+        if error is None:
+            self._stats["written"] += len(rows)
+        else:
+            self._stats["dropped"] += len(rows)
+            logger.error(f"Dropping {len(rows)} readings after {self.max_retries} failed flushes: {error}")
+        self._stats["flushes"] += 1
+        self._stats["last_flush_rows"] = len(rows)
+        self._stats["last_flush_seconds"] = elapsed
+        self._stats["total_flush_seconds"] += elapsed
+        self._stats["max_flush_seconds"] = max(self._stats["max_flush_seconds"], elapsed)
+
+        # Resolve waiters once every row they submitted has been flushed
+        for _, pending in batch:
+            pending[0] -= 1
+            future = pending[1]
+            if future is None or future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            elif pending[0] == 0:
+                future.set_result(None)
@@ -0,0 +1,83 @@
+import asyncio
+import json
+import logging
+from typing import Dict, Iterable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """
+    One live connection's view of the reading stream.
+
+    Readings matching the subscription's devices and sensor types are put on a
+    bounded queue. When a slow client lets the queue fill up, the oldest
+    reading is dropped so the publisher never waits.
+    """
+
+    def __init__(self, device_ids: Set[str], sensor_types: Set[str], max_queue: int = 100):
+        self.device_ids = device_ids
+        self.sensor_types = sensor_types
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def offer(self, message: Dict):
+        if message["sensor_type"] not in self.sensor_types:
+            return
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict]:
+        """Wait for the next reading, or return None after timeout seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class ReadingBroadcaster:
+    """Fans accepted readings out to the live subscriptions of the devices they came from."""
+
+    def __init__(self, max_queue: int = 100):
+        self.max_queue = max_queue
+        self._by_device: Dict[str, Set[Subscription]] = {}
+        self.published = 0
+
+    def subscribe(self, device_ids: Iterable[str], sensor_types: Iterable[str]) -> Subscription:
+        subscription = Subscription(set(device_ids), set(sensor_types), self.max_queue)
+        for device_id in subscription.device_ids:
+            self._by_device.setdefault(device_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for device_id in subscription.device_ids:
+            subscribers = self._by_device.get(device_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._by_device[device_id]
+
+    def publish(self, sensor_type: str, reading: Dict):
+        """Hand a reading to every subscription watching its device. Must run on the event loop."""
+        subscribers = self._by_device.get(reading["device_id"])
+        if not subscribers:
+            return
+        message = {"sensor_type": sensor_type, **reading}
+        for subscription in subscribers:
+            subscription.offer(message)
+        self.published += 1
+
+    def stats(self) -> Dict:
+        subscriptions = set().union(*self._by_device.values()) if self._by_device else set()
+        return {
+            "subscriptions": len(subscriptions),
+            "published": self.published,
+            "dropped": sum(subscription.dropped for subscription in subscriptions),
+        }
+
+
+def format_event(message: Dict, event: str = "reading") -> str:
+    """Format a message as a Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(message)}\n\n"
@@ -1,7 +1,14 @@
+import asyncio
+import base64
+import csv
+import io
+import json
 import os
+import re
 import uuid
+import weakref
 from contextlib import asynccontextmanager
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Dict, List
 
 import mysql.connector as mysql
@@ -9,23 +16,48 @@ import requests
 from dotenv import load_dotenv
 from fastapi import (Body, FastAPI, HTTPException, Query, Request, Response,
                      status)
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel, validator
-
+from pydantic import BaseModel, ValidationError, validator
+
+from app.cache import DeviceRegistry, LatestReadingCache, TTLCache
+from app.ingest import ACK_ON_ENQUEUE, IngestBuffer, IngestQueueFull
+from app.analytics import compute_reading_stats, correlation
+from app.export import EXPORT_MEDIA_TYPES, export_formats, export_readings
+from app.importer import import_csv
+from app.live import ReadingBroadcaster, format_event
+from app.partitions import PARTITION_CHECK_INTERVAL, maintain_partitions_async
 from app.database import (
     add_device, 
+    bucket_start,
+    close_pool,
     create_session, 
+    DatabaseConnectionError,
     delete_device,
     delete_session, 
-    get_db_connection,
+    get_device_owners,
     get_devices_by_device_id, 
     get_devices_by_user_id,
+    get_latest_sensor_reading,
+    get_latest_sensor_readings,
+    get_pool_stats,
+    get_replica_stats,
+    get_sensor_aggregates,
+    get_sensor_readings,
+    get_sensor_summary,
     get_session, 
     get_user_by_id, 
     get_user_by_username,
     setup_database,
     add_wardrobe_item,
+    insert_sensor_reading,
+    insert_sensor_readings,
+    iter_sensor_readings,
+    iterate_in_executor,
+    SENSOR_COLUMNS,
+    SENSOR_AGGREGATES,
+    SENSOR_STORAGE,
+    SENSOR_TYPES,
     get_wardrobe_items_by_user_id,
     delete_wardrobe_item)
 load_dotenv()
@@ -36,7 +68,49 @@ PID = os.getenv("PID")
 # Initial users for setup
 INIT_USERS = {"alice": "pass123", "bob": "pass456", "tony": "tonypas123"}
 
+# Sessions live as long as the sessionID cookie. Each worker caches them for at most
+# SESSION_CACHE_TTL seconds, so a logout on one worker reaches the others within that time
+SESSION_MAX_AGE = 3600
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", 30))
+session_cache = TTLCache(maxsize=int(os.getenv("SESSION_CACHE_SIZE", 10000)), ttl=SESSION_CACHE_TTL)
+
+# Users who changed their devices or wardrobe within the last READ_YOUR_WRITES_WINDOW
+# seconds read them back from the primary, so they never see a stale replica
+recent_writers = TTLCache(maxsize=int(os.getenv("SESSION_CACHE_SIZE", 10000)),
+                          ttl=float(os.getenv("READ_YOUR_WRITES_WINDOW", 10)))
+
+# Registered devices, reloaded periodically so all workers converge
+device_registry = DeviceRegistry()
+DEVICE_REGISTRY_REFRESH = float(os.getenv("DEVICE_REGISTRY_REFRESH", 60))
+
+# Latest reading per sensor type and device; set a TTL when running several workers
+latest_readings = LatestReadingCache(ttl=float(os.getenv("LATEST_CACHE_TTL", 0)))
+
+# Live reading stream for dashboards (Server-Sent Events)
+broadcaster = ReadingBroadcaster(max_queue=int(os.getenv("LIVE_QUEUE_SIZE", 100)))
+LIVE_HEARTBEAT = float(os.getenv("LIVE_HEARTBEAT", 15))
+
 api_key = os.environ.get("API_KEY", "")
+# Page size for sensor history queries; no request can load more than SENSOR_PAGE_MAX rows
+SENSOR_PAGE_DEFAULT = int(os.getenv("SENSOR_PAGE_DEFAULT", 500))
+SENSOR_PAGE_MAX = int(os.getenv("SENSOR_PAGE_MAX", 5000))
+# Maximum number of readings accepted by one batch ingest request
+SENSOR_BATCH_MAX = int(os.getenv("SENSOR_BATCH_MAX", 5000))
+
+# Usernames allowed to use the /api/admin endpoints, and the directory CSV imports read from
+ADMIN_USERS = {name.strip() for name in os.getenv("ADMIN_USERS", "").split(",") if name.strip()}
+IMPORT_DIR = os.path.realpath(os.getenv("IMPORT_DIR", "sample"))
+import_jobs: Dict[str, Dict] = {}
+
+# Optional write-behind ingest: readings are queued and written in group commits
+INGEST_WRITE_BEHIND = os.getenv("INGEST_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+ingest_buffer = IngestBuffer(
+    insert_sensor_readings,
+    max_queue=int(os.getenv("INGEST_QUEUE_SIZE", 10000)),
+    batch_size=int(os.getenv("INGEST_BATCH_SIZE", 500)),
+    flush_interval=float(os.getenv("INGEST_FLUSH_INTERVAL", 0.5)),
+    ack=os.getenv("INGEST_ACK", ACK_ON_ENQUEUE),
+) if INGEST_WRITE_BEHIND else None
 # Sensor data model
 class SensorData(BaseModel):
     value: float
@@ -54,55 +128,70 @@ class SensorData(BaseModel):
         except ValueError:
             raise ValueError("Invalid date format. Expected format: YYYY-MM-DD HH:MM:SS")
 
+# Bulk CSV import request (file is relative to IMPORT_DIR)
+class ImportRequest(BaseModel):
+    file: str
+    sensor_type: str = None
+    device_id: str = None
+    unit: str = None
+    timestamp_format: str = None
+
+# Sensor reading model for batch ingest
+class SensorReading(SensorData):
+    sensor_type: str
+
+    @validator('sensor_type')
+    def validate_sensor_type(cls, value):
+        if value not in SENSOR_TYPES:
+            raise ValueError(f"Unknown sensor type. Expected one of: {', '.join(SENSOR_TYPES)}")
+        return value
+
+async def refresh_device_registry():
+    """Reload the device registry every DEVICE_REGISTRY_REFRESH seconds."""
+    while True:
+        await asyncio.sleep(DEVICE_REGISTRY_REFRESH)
+        try:
+            device_registry.load(await get_device_owners())
+        except Exception as e:
+            print(f"Device registry refresh failed: {e}")
+
+async def manage_partitions():
+    """Create upcoming reading partitions and drop expired ones every PARTITION_CHECK_INTERVAL seconds."""
+    while True:
+        await asyncio.sleep(PARTITION_CHECK_INTERVAL)
+        try:
+            await maintain_partitions_async()
+        except Exception as e:
+            print(f"Partition maintenance failed: {e}")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for managing application startup and database setup."""
     try:
         await setup_database(INIT_USERS)
         print("Database setup completed")
-        # Also set up sensor tables
-        conn = get_db_connection()  # Remove the await here
-        cursor = conn.cursor()
-        
-        # Create sensor tables if they don't exist
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS temperature (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            device_id VARCHAR(255) NOT NULL,
-            timestamp DATETIME NOT NULL,
-            value FLOAT NOT NULL,
-            unit VARCHAR(10) NOT NULL
-        )
-        """)
-        
-        
-        
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS humidity (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            device_id VARCHAR(255) NOT NULL,
-            timestamp DATETIME NOT NULL,
-            value FLOAT NOT NULL,
-            unit VARCHAR(10) NOT NULL
-        )
-        """)
-        
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS light (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            device_id VARCHAR(255) NOT NULL,
-            timestamp DATETIME NOT NULL,
-            value FLOAT NOT NULL,
-            unit VARCHAR(10) NOT NULL
-        )
-        """)
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        device_registry.load(await get_device_owners())
+        registry_task = asyncio.create_task(refresh_device_registry())
+        partition_task = None
+        if SENSOR_STORAGE == "partitioned":
+            # Creates the readings table when switching an existing database, before any ingest
+            await maintain_partitions_async()
+            partition_task = asyncio.create_task(manage_partitions())
+        for sensor_type in SENSOR_TYPES:
+            for reading in await get_latest_sensor_readings(sensor_type):
+                latest_readings.update(sensor_type, reading["device_id"], serialize_reading(reading))
+        if ingest_buffer:
+            await ingest_buffer.start()
         
         yield
+
+        registry_task.cancel()
+        if partition_task:
+            partition_task.cancel()
     finally:
+        if ingest_buffer:
+            await ingest_buffer.stop()
+        close_pool()
         print("Shutdown completed")
 
 # Create the FastAPI application with the defined lifespan
@@ -136,9 +225,97 @@ def correct_date_time(value: str):
         raise HTTPException(
             status_code=400, detail="Invalid date format. Expected format: YYYY-MM-DD HH:MM:SS")
 
+BUCKET_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+def parse_bucket(value: str) -> int:
+    """Parse a bucket interval such as 30s, 5m, 1h or 1d into seconds."""
+    match = re.fullmatch(r"(\d+)([smhd])", value.strip())
+    if not match or int(match.group(1)) == 0:
+        raise HTTPException(
+            status_code=400, detail="Invalid bucket. Expected a number followed by s, m, h or d (e.g. 5m)")
+    return int(match.group(1)) * BUCKET_UNITS[match.group(2)]
+
+def parse_aggregates(value: str) -> List[str]:
+    """Parse a comma separated list of aggregate names."""
+    aggregates = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in aggregates if name not in SENSOR_AGGREGATES]
+    if unknown or not aggregates:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid aggregate. Expected any of: {', '.join(SENSOR_AGGREGATES)}")
+    return aggregates
+
+def encode_cursor(mode: str, key: list) -> str:
+    """Encode a pagination keyset as an opaque cursor string."""
+    raw = json.dumps({"m": mode, "k": key}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, mode: str, types: tuple) -> list:
+    """Decode a cursor produced by encode_cursor for the given pagination mode, whose key holds values of types."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if data["m"] != mode:
+            raise ValueError("cursor belongs to a different query")
+        key = data["k"]
+        if not isinstance(key, list) or len(key) != len(types) \
+                or not all(isinstance(value, kind) for value, kind in zip(key, types)):
+            raise ValueError("malformed key")
+        return key
+    except (ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+
 # Session validation
+async def lookup_session(session_id: str):
+    """
+    Resolve a session ID to its user, using the session cache before the database.
+
+    Sessions older than SESSION_MAX_AGE are expired, and a cached entry never
+    outlives its session.
+    """
+    user = session_cache.get(session_id)
+    if user is None:
+        user = await get_session(session_id)
+        if not user:
+            return None
+        remaining = SESSION_MAX_AGE - user.pop("age")
+        if remaining <= 0:
+            return None
+        session_cache.set(session_id, user, ttl=min(SESSION_CACHE_TTL, remaining))
+    return user
+
+async def is_registered_device(device_id: str) -> bool:
+    """Check a device against the registry, consulting the database only for unknown IDs."""
+    if device_id in device_registry:
+        return True
+    owners = await get_device_owners([device_id])
+    for _, user_id in owners:
+        device_registry.add(device_id, user_id)
+    return bool(owners)
+
+def owns_device(user: Dict, device_id: str) -> bool:
+    """
+    Check whether the authenticated user owns a device.
+
+    The device set comes with the session, so it is at most SESSION_CACHE_TTL
+    seconds old on any worker. The device registry is not consulted: other
+    workers only reload it every DEVICE_REGISTRY_REFRESH seconds.
+    """
+    return device_id in user["device_ids"]
+
+def forget_user_sessions(user_id: int):
+    """Drop this worker's cached sessions of a user so their device set is reloaded right away."""
+    session_cache.discard_where(lambda user: user["user_id"] == user_id)
+
 async def require_authenticated_user(request: Request):
-    """Ensure that the user is authenticated, otherwise redirect to the login page."""
+    """
+    Ensure that the user is authenticated, otherwise redirect to the login page.
+
+    Returns the session identity (user_id, username and the set of owned
+    device_ids). It is resolved once per request and reused by later calls.
+    """
+    user = getattr(request.state, "user", None)
+    if user is not None:
+        return user
+
     session_id = request.cookies.get("sessionID")
     
     if not session_id:
@@ -148,7 +325,7 @@ async def require_authenticated_user(request: Request):
             headers={"Location": "/login"}
         )
 
-    user = await get_session(session_id)
+    user = await lookup_session(session_id)
     
     if not user:
         raise HTTPException(
@@ -157,6 +334,7 @@ async def require_authenticated_user(request: Request):
             headers={"Location": "/login"}
         )
 
+    request.state.user = user
     return user
 
 # Routes
@@ -222,16 +400,10 @@ async def get_all_devices(request: Request):
         # Authenticate user
         user = await require_authenticated_user(request)
         
-        # Get user ID from session
-        user_details = await get_user_by_username(user["username"])
-        
-        if not user_details:
-            return JSONResponse(content={"error": "User not found"}, status_code=404)
-            
-        user_id = user_details["id"]
+        user_id = user["user_id"]
 
         # Get devices from database
-        devices = await get_devices_by_user_id(user_id)
+        devices = await get_devices_by_user_id(user_id, consistent=recent_writers.get(user_id, False))
         
         return JSONResponse(content={"devices": devices})
     except HTTPException as e:
@@ -254,9 +426,7 @@ async def add_device_api(
         # Authenticate user
         user = await require_authenticated_user(request)
         
-        # Get user ID from session
-        user_details = await get_user_by_username(user["username"])
-        user_id = user_details["id"]
+        user_id = user["user_id"]
 
         # Validate request data
         device_id = data.get("deviceId")
@@ -271,6 +441,9 @@ async def add_device_api(
         success = await add_device(device_id, user_id)
         
         if success:
+            recent_writers.set(user_id, True)
+            device_registry.add(device_id, user_id)
+            forget_user_sessions(user_id)
             return JSONResponse(content={"success": True})
         else:
             return JSONResponse(
@@ -294,14 +467,15 @@ async def delete_device_api(
         # Authenticate user
         user = await require_authenticated_user(request)
         
-        # Get user ID from session
-        user_details = await get_user_by_username(user["username"])
-        user_id = user_details["id"]
+        user_id = user["user_id"]
 
         # Delete device from database
         success = await delete_device(device_id, user_id)
         
         if success:
+            recent_writers.set(user_id, True)
+            device_registry.remove(device_id, user_id)
+            forget_user_sessions(user_id)
             return JSONResponse(content={"success": True})
         else:
             return JSONResponse(
@@ -330,8 +504,7 @@ async def dashboard(request: Request):
 async def wardrobe(request: Request):
     """Show the wardrobe if authenticated"""
     user = await require_authenticated_user(request)
-    user_details = await get_user_by_username(user["username"])
-    user_id = user_details["id"]
+    user_id = user["user_id"]
     
     # Use a template engine properly or do a better replacement
     html_content = read_html("app/wardrobe.html")
@@ -347,19 +520,13 @@ async def get_wardrobe_api(request: Request):
         # Authenticate user
         user = await require_authenticated_user(request)
         
-        # Get user ID from session
-        user_details = await get_user_by_username(user["username"])
-        
-        if not user_details:
-            return JSONResponse(content={"error": "User not found"}, status_code=404)
-            
-        user_id = user_details["id"]
+        user_id = user["user_id"]
         
         # Add logging to verify user_id
         print(f"Fetching wardrobe items for user_id: {user_id}")
 
         # Get wardrobe items from database
-        items = await get_wardrobe_items_by_user_id(user_id)
+        items = await get_wardrobe_items_by_user_id(user_id, consistent=recent_writers.get(user_id, False))
         
         # Add verification that all items belong to this user
         for item in items:
@@ -385,9 +552,7 @@ async def add_wardrobe_item_api(request: Request, data: dict = Body(...)):
         # Authenticate user
         user = await require_authenticated_user(request)
         
-        # Get user ID from session
-        user_details = await get_user_by_username(user["username"])
-        user_id = user_details["id"]
+        user_id = user["user_id"]
 
         # Log received data
         print(f"Received wardrobe item data: {data}")
@@ -411,6 +576,7 @@ async def add_wardrobe_item_api(request: Request, data: dict = Body(...)):
         print(f"Result from add_wardrobe_item: {item_id}")
         
         if item_id:
+            recent_writers.set(user_id, True)
             return JSONResponse(content={"success": True, "id": item_id})
         else:
             return JSONResponse(
@@ -433,9 +599,7 @@ async def delete_wardrobe_item_api(
         # Authenticate user
         user = await require_authenticated_user(request)
         
-        # Get user ID from session
-        user_details = await get_user_by_username(user["username"])
-        user_id = user_details["id"]
+        user_id = user["user_id"]
 
         print(f"Attempting to delete item {item_id} for user {user_id}")
 
@@ -445,6 +609,7 @@ async def delete_wardrobe_item_api(
         print(f"Delete result: {success}")
         
         if success:
+            recent_writers.set(user_id, True)
             return JSONResponse(content={"success": True})
         else:
             return JSONResponse(
@@ -471,7 +636,7 @@ async def login_page(request: Request):
     """Show login page or redirect to user profile if already logged in"""
     session_id = request.cookies.get("sessionID")
     if session_id:
-        user = await get_session(session_id)
+        user = await lookup_session(session_id)
         
         if user:
             return RedirectResponse(url=f"/user/{user['username']}", status_code=303)
@@ -494,7 +659,7 @@ async def login(request: Request):
     await create_session(user["id"], session_id)
 
     response = RedirectResponse(url=f"/user/{user_name}", status_code=303)
-    response.set_cookie(key="sessionID", value=session_id, httponly=True, max_age=3600)
+    response.set_cookie(key="sessionID", value=session_id, httponly=True, max_age=SESSION_MAX_AGE)
     return response
 
 @app.post("/logout")
@@ -503,6 +668,7 @@ async def logout(request: Request):
     session_id = request.cookies.get("sessionID")
     
     if session_id:
+        session_cache.pop(session_id)
         await delete_session(session_id)
 
     redirect_response = RedirectResponse(url="/login", status_code=303)
@@ -528,58 +694,392 @@ def dashboard_redirect():
 
 #------------- INTEGRATED SENSOR API ENDPOINTS -------------#
 
-async def get_sensory_data(sensor_type, device_id=None, order_by=None, start_date=None, end_date=None):
-    """Get sensor data with optional filtering"""
-    valid_sensory_types = ["temperature", "light", "humidity"]
-    if sensor_type not in valid_sensory_types:
+def serialize_reading(row: Dict) -> Dict:
+    """Convert a reading row to JSON-ready values."""
+    if isinstance(row.get('timestamp'), datetime):
+        row['timestamp'] = row['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
+    return row
+
+def readings_accepted(rows: list, ids: list = None):
+    """Update in-memory state with newly accepted (sensor_type, device_id, timestamp, value, unit) rows."""
+    for index, (sensor_type, device_id, timestamp, value, unit) in enumerate(rows):
+        reading = {"device_id": device_id, "timestamp": timestamp, "value": value, "unit": unit}
+        if ids:
+            reading["id"] = ids[index]
+        latest_readings.update(sensor_type, device_id, reading)
+        broadcaster.publish(sensor_type, reading)
+
+async def store_sensor_readings(rows: list):
+    """Store (sensor_type, device_id, timestamp, value, unit) rows, through the write-behind buffer if enabled."""
+    try:
+        if ingest_buffer:
+            await ingest_buffer.submit(rows)
+        else:
+            await insert_sensor_readings(rows)
+    except IngestQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except DatabaseConnectionError as e:
+        # No connection could be opened or checked out of the pool in time; a later retry may succeed
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {e}")
+    readings_accepted(rows)
+
+async def get_sensory_data(sensor_type, device_id=None, order_by=None, start_date=None, end_date=None,
+                           bucket=None, aggregates=None, limit=None, cursor=None):
+    """
+    Get a page of sensor data with optional filtering.
+
+    With a bucket interval (e.g. "5m") the readings are aggregated per bucket
+    in SQL, computing the comma separated aggregates (avg by default).
+    Returns {"data": rows, "next": cursor}; pass "next" back as cursor to get
+    the following page, it is None on the last page.
+    """
+    if sensor_type not in SENSOR_TYPES:
         raise HTTPException(status_code=404, detail="Sensor type not found")
 
-    conn =  get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    query = f"SELECT * FROM {sensor_type}"
-    parameters = []
-
-    where_clauses = []
-    
-    if device_id:
-        where_clauses.append("device_id = %s")
-        parameters.append(device_id)
-
     if start_date:
         start_date = correct_date_time(start_date)
-        where_clauses.append("timestamp >= %s")
-        parameters.append(start_date)
-
     if end_date:
         end_date = correct_date_time(end_date)
-        where_clauses.append("timestamp <= %s")
-        parameters.append(end_date)
-        
-    if where_clauses:
-        query += " WHERE " + " AND ".join(where_clauses)
-
-    if order_by:
-        if order_by == "value":
-            query += " ORDER BY value"
-        elif order_by == "timestamp":
-            query += " ORDER BY timestamp DESC"
-            
-    # Default ordering if none specified
+    limit = min(limit or SENSOR_PAGE_DEFAULT, SENSOR_PAGE_MAX)
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+
+    # Fetch one extra row to know whether another page exists
+    if bucket:
+        mode = f"bucket:{bucket}"
+        before = correct_date_time(decode_cursor(cursor, mode, (str,))[0]) if cursor else None
+        result = await get_sensor_aggregates(
+            sensor_type, parse_bucket(bucket), parse_aggregates(aggregates or "avg"),
+            device_id, start_date, end_date, limit + 1, before
+        )
     else:
-        query += " ORDER BY timestamp DESC"
+        mode = "value" if order_by == "value" else "timestamp"
+        after = None
+        if cursor:
+            sort_value, row_id = decode_cursor(cursor, mode, ((int, float) if mode == "value" else str, int))
+            after = (sort_value if mode == "value" else correct_date_time(sort_value), row_id)
+        result = await get_sensor_readings(
+            sensor_type, device_id, order_by, start_date, end_date, limit + 1, after
+        )
 
-    cursor.execute(query, tuple(parameters))
-    result = cursor.fetchall()
+    has_more = len(result) > limit
+    result = result[:limit]
 
     # Process datetime objects to strings
     for row in result:
         if 'timestamp' in row and isinstance(row['timestamp'], datetime):
             row['timestamp'] = row['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
 
-    cursor.close()
-    conn.close()
-    return result
+    next_cursor = None
+    if has_more:
+        last = result[-1]
+        if bucket:
+            next_cursor = encode_cursor(mode, [last["timestamp"]])
+        elif mode == "value":
+            next_cursor = encode_cursor(mode, [last["value"], last["id"]])
+        else:
+            next_cursor = encode_cursor(mode, [last["timestamp"], last["id"]])
+
+    return {"data": result, "next": next_cursor}
+
+STREAM_MEDIA_TYPES = ("application/x-ndjson", "text/csv")
+
+# Every open stream or export holds a read connection until its client has read it all
+SENSOR_STREAMS_PER_USER = int(os.getenv("SENSOR_STREAMS_PER_USER", 2))
+open_streams: Dict[int, weakref.WeakSet] = {}
+
+def track_stream(user, body):
+    """
+    Count a streaming response body against the user's limit, or raise 429.
+
+    Bodies leave the set when they finish or, if the client went away before
+    the first chunk, when they are garbage collected.
+    """
+    streams = open_streams.setdefault(user["user_id"], weakref.WeakSet())
+    if sum(1 for stream in streams if stream.ag_frame is not None) >= SENSOR_STREAMS_PER_USER:
+        raise HTTPException(status_code=429, detail="Too many concurrent streams")
+    streams.add(body)
+    return body
+
+async def stream_sensory_data(media_type, user, sensor_type, device_id=None, order_by=None, start_date=None,
+                              end_date=None):
+    """
+    Stream every matching reading as NDJSON or CSV, chunk by chunk from a server-side cursor.
+
+    Without a device_id, the readings of all the user's devices are streamed.
+    """
+    if sensor_type not in SENSOR_TYPES:
+        raise HTTPException(status_code=404, detail="Sensor type not found")
+    if start_date:
+        start_date = correct_date_time(start_date)
+    if end_date:
+        end_date = correct_date_time(end_date)
+
+    device_ids = device_id or sorted(user["device_ids"])
+    chunks = iterate_in_executor(
+        iter_sensor_readings(sensor_type, device_ids, order_by, start_date, end_date)
+    )
+
+    async def ndjson():
+        async for rows in chunks:
+            yield "".join(
+                json.dumps(dict(zip(SENSOR_COLUMNS, (id_, device, str(timestamp), value, unit)))) + "\n"
+                for id_, device, timestamp, value, unit in rows
+            )
+
+    async def csv_rows():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(SENSOR_COLUMNS)
+        yield buffer.getvalue()
+        async for rows in chunks:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(rows)
+            yield buffer.getvalue()
+
+    if media_type == "text/csv":
+        return StreamingResponse(
+            track_stream(user, csv_rows()), media_type="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="{sensor_type}.csv"'}
+        )
+    return StreamingResponse(track_stream(user, ndjson()), media_type="application/x-ndjson")
+
+@app.get("/api/sensor/{sensor_type}/export")
+async def export_sensor_data(
+    sensor_type: str,
+    request: Request,
+    device_id: str = Query(None),
+    start_date: str = Query(None, alias="start-date"),
+    end_date: str = Query(None, alias="end-date"),
+    requested_format: str = Query(None, alias="format")
+):
+    """
+    Export the readings of one device, or of all the user's devices, as a columnar file.
+
+    ?format=parquet or arrow (when pyarrow is installed) or npz; defaults to
+    the first available. Rows are read from a server-side cursor and encoded
+    chunk by chunk while the file is streamed.
+    """
+    try:
+        user = await require_authenticated_user(request)
+        if sensor_type not in SENSOR_TYPES:
+            raise HTTPException(status_code=404, detail="Sensor type not found")
+        export_format = requested_format or export_formats()[0]
+        if export_format not in export_formats():
+            raise HTTPException(
+                status_code=400, detail=f"Unsupported format. Expected one of: {', '.join(export_formats())}")
+        if device_id:
+            if not owns_device(user, device_id):
+                return JSONResponse(content={"error": "Device not found or not authorized"}, status_code=403)
+            device_ids = [device_id]
+        else:
+            device_ids = sorted(user["device_ids"])
+        start = correct_date_time(start_date) if start_date else None
+        end = correct_date_time(end_date) if end_date else None
+
+        async def chunks():
+            for device in device_ids:
+                async for rows in iterate_in_executor(
+                    iter_sensor_readings(sensor_type, device, None, start, end)
+                ):
+                    yield rows
+
+        name = f"{sensor_type}-{device_id}" if device_id else sensor_type
+        return StreamingResponse(
+            track_stream(user, export_readings(chunks(), export_format)),
+            media_type=EXPORT_MEDIA_TYPES[export_format],
+            headers={"Content-Disposition": f'attachment; filename="{name}.{export_format}"'}
+        )
+    except HTTPException as e:
+        if e.status_code == 303:  # Redirect for authentication
+            return JSONResponse(content={"error": "Authentication required"}, status_code=401)
+        raise
+
+STATS_MAX_POINTS = 10000
+
+@app.get("/api/sensor/{sensor_type}/stats")
+async def get_sensor_stats(
+    sensor_type: str,
+    request: Request,
+    device_id: str = Query(...),
+    start_date: str = Query(None, alias="start-date"),
+    end_date: str = Query(None, alias="end-date"),
+    step: str = Query(None),
+    window: str = Query(None),
+    percentiles: str = Query("5,25,50,75,95")
+):
+    """
+    Get statistics of a device's readings without downloading them.
+
+    Returns count, mean, std, min, max, percentiles, the rate of change
+    between consecutive readings and a rolling mean over `window` sampled
+    every `step` (e.g. step=5m&window=1h; by default about 500 steps over the
+    range and a window of 12 steps). For temperature and humidity it also
+    returns their correlation over step-aligned bucket averages.
+    """
+    try:
+        user = await require_authenticated_user(request)
+        if sensor_type not in SENSOR_TYPES:
+            raise HTTPException(status_code=404, detail="Sensor type not found")
+        if not owns_device(user, device_id):
+            return JSONResponse(content={"error": "Device not found or not authorized"}, status_code=403)
+        start = correct_date_time(start_date) if start_date else None
+        end = correct_date_time(end_date) if end_date else None
+        try:
+            quantiles = [float(q) for q in percentiles.split(",") if q.strip()]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid percentiles. Expected numbers such as 5,50,95")
+        if not all(0 <= q <= 100 for q in quantiles):
+            raise HTTPException(status_code=400, detail="Percentiles must be between 0 and 100")
+
+        summary = await get_sensor_summary(sensor_type, device_id, start, end)
+        if not summary["count"]:
+            return JSONResponse(content={"sensor_type": sensor_type, "device_id": device_id, "count": 0})
+        span = (summary["last"] - summary["first"]).total_seconds()
+        step_seconds = parse_bucket(step) if step else max(60, int(span // 500) + 1)
+        window_seconds = parse_bucket(window) if window else 12 * step_seconds
+        if window_seconds < step_seconds or window_seconds % step_seconds:
+            raise HTTPException(status_code=400, detail="window must be a multiple of step")
+        if span / step_seconds > STATS_MAX_POINTS:
+            raise HTTPException(status_code=400, detail=f"step is too small for this range (at most {STATS_MAX_POINTS} steps)")
+
+        tasks = [compute_reading_stats(sensor_type, device_id, summary, start, end,
+                                       step_seconds, window_seconds, quantiles)]
+        if sensor_type in ("temperature", "humidity"):
+            # Bound both series to this sensor's range, whole steps so rollups can answer
+            range_start = start or bucket_start(summary["first"], step_seconds)
+            range_end = end or bucket_start(summary["last"], step_seconds) + timedelta(seconds=step_seconds - 1)
+            tasks += [
+                get_sensor_aggregates(name, step_seconds, ["avg"], device_id, range_start, range_end,
+                                      limit=STATS_MAX_POINTS + 1)
+                for name in ("temperature", "humidity")
+            ]
+        results = await asyncio.gather(*tasks)
+
+        content = {"sensor_type": sensor_type, "device_id": device_id, **results[0]}
+        if len(results) == 3:
+            content["correlation"] = {"with": "temperature/humidity", "step": step_seconds,
+                                      **correlation(results[1], results[2])}
+        return JSONResponse(content=content)
+    except HTTPException as e:
+        if e.status_code == 303:  # Redirect for authentication
+            return JSONResponse(content={"error": "Authentication required"}, status_code=401)
+        raise
+
+@app.get("/api/sensor/stream")
+async def stream_sensor_readings(
+    request: Request,
+    device_id: List[str] = Query(None),
+    types: str = Query(None)
+):
+    """
+    Stream new readings of the user's devices as Server-Sent Events.
+
+    Optional filters: ?device_id=a&device_id=b (default: all owned devices)
+    and ?types=temperature,humidity (default: all sensor types).
+    """
+    try:
+        user = await require_authenticated_user(request)
+    except HTTPException as e:
+        if e.status_code == 303:  # Redirect for authentication
+            return JSONResponse(content={"error": "Authentication required"}, status_code=401)
+        raise
+
+    device_ids = set(device_id) if device_id else set(user["device_ids"])
+    if not all(owns_device(user, device) for device in device_ids):
+        return JSONResponse(content={"error": "Device not found or not authorized"}, status_code=403)
+    sensor_types = set(types.split(",")) if types else set(SENSOR_TYPES)
+    if not sensor_types <= set(SENSOR_TYPES):
+        raise HTTPException(status_code=404, detail="Sensor type not found")
+
+    subscription = broadcaster.subscribe(device_ids, sensor_types)
+
+    async def events():
+        try:
+            yield format_event({"device_ids": sorted(device_ids), "sensor_types": sorted(sensor_types)}, "subscribed")
+            while not await request.is_disconnected():
+                message = await subscription.get(timeout=LIVE_HEARTBEAT)
+                # A comment line keeps proxies from closing an idle stream
+                yield format_event(message) if message else ": heartbeat\n\n"
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/sensor/series")
+async def get_sensor_series(
+    request: Request,
+    types: str = Query(None),
+    device_id: List[str] = Query(None),
+    start_date: str = Query(None, alias="start-date"),
+    end_date: str = Query(None, alias="end-date"),
+    bucket: str = Query(None),
+    agg: str = Query(None),
+    limit: int = Query(None)
+):
+    """
+    Get several sensor series in one call, as columnar arrays.
+
+    ?types=temperature,humidity (default: all) and ?device_id=a&device_id=b
+    (default: all owned devices) select the series; each is queried
+    concurrently and returned oldest first as
+    {"sensor_type", "device_id", "timestamps": [...], "values": [...]}.
+    With a bucket, there is one array per aggregate instead of "values".
+    """
+    try:
+        user = await require_authenticated_user(request)
+
+        device_ids = sorted(set(device_id)) if device_id else sorted(user["device_ids"])
+        if not all(owns_device(user, device) for device in device_ids):
+            return JSONResponse(content={"error": "Device not found or not authorized"}, status_code=403)
+        sensor_types = [name for name in types.split(",") if name] if types else list(SENSOR_TYPES)
+        if not set(sensor_types) <= set(SENSOR_TYPES):
+            raise HTTPException(status_code=404, detail="Sensor type not found")
+
+        start = correct_date_time(start_date) if start_date else None
+        end = correct_date_time(end_date) if end_date else None
+        limit = min(limit or SENSOR_PAGE_DEFAULT, SENSOR_PAGE_MAX)
+        if limit < 1:
+            raise HTTPException(status_code=400, detail="limit must be positive")
+        keys = [(sensor_type, device) for sensor_type in sensor_types for device in device_ids]
+
+        if bucket:
+            bucket_seconds, aggregates = parse_bucket(bucket), parse_aggregates(agg or "avg")
+            columns = aggregates
+            queries = [
+                get_sensor_aggregates(sensor_type, bucket_seconds, aggregates, device, start, end, limit)
+                for sensor_type, device in keys
+            ]
+        else:
+            columns = ["value"]
+            queries = [
+                get_sensor_readings(sensor_type, device, None, start, end, limit)
+                for sensor_type, device in keys
+            ]
+        results = await asyncio.gather(*queries)
+
+        series = []
+        for (sensor_type, device), rows in zip(keys, results):
+            rows.reverse()  # queries return newest first
+            entry = {
+                "sensor_type": sensor_type,
+                "device_id": device,
+                "timestamps": [serialize_reading(row)["timestamp"] for row in rows],
+            }
+            for column in columns:
+                entry["values" if column == "value" else column] = [row[column] for row in rows]
+            series.append(entry)
+        return JSONResponse(content={"series": series})
+    except HTTPException as e:
+        if e.status_code == 303:  # Redirect for authentication
+            return JSONResponse(content={"error": "Authentication required"}, status_code=401)
+        raise
+    except Exception as e:
+        return JSONResponse(content={"error": str(e)}, status_code=500)
 
 @app.get("/api/sensor/{sensor_type}")
 async def get_sensor_data(
@@ -588,29 +1088,44 @@ async def get_sensor_data(
     device_id: str = None,
     order_by: str = Query(None, alias="order-by"),
     start_date: str = Query(None, alias="start-date"),
-    end_date: str = Query(None, alias="end-date")
+    end_date: str = Query(None, alias="end-date"),
+    bucket: str = Query(None),
+    agg: str = Query(None),
+    limit: int = Query(None),
+    cursor: str = Query(None)
 ):
-    """Get sensor data with optional filtering"""
+    """
+    Get a page of sensor data with optional filtering, or aggregated per bucket (e.g. ?bucket=5m&agg=avg,max).
+
+    The response is {"data": [...], "next": cursor}; request ?cursor=<next> for the following page.
+    With Accept: application/x-ndjson or text/csv, all matching raw readings are streamed instead.
+    """
     try:
         # Authenticate user
-        user =  require_authenticated_user(request)
-        
-        # Get user ID from session
-        user_details = await get_user_by_username(user["username"])
-        user_id = user_details["id"]
+        user = await require_authenticated_user(request)
         
         # If device_id is specified, verify user owns this device
         if device_id:
-            devices = await get_devices_by_user_id(user_id)
-            if not any(device['device_id'] == device_id for device in devices):
+            if not owns_device(user, device_id):
                 return JSONResponse(
                     content={"error": "Device not found or not authorized"}, 
                     status_code=403
                 )
         
+        # Stream the whole range if the client asked for NDJSON or CSV
+        accept = request.headers.get("accept", "")
+        media_type = next((media for media in STREAM_MEDIA_TYPES if media in accept), None)
+        if media_type:
+            if bucket:
+                return JSONResponse(
+                    content={"error": "Streaming is only available for raw readings"},
+                    status_code=400
+                )
+            return await stream_sensory_data(media_type, user, sensor_type, device_id, order_by, start_date, end_date)
+
         # Get sensor data
         retrieved_data = await get_sensory_data(
-            sensor_type, device_id, order_by, start_date, end_date
+            sensor_type, device_id, order_by, start_date, end_date, bucket, agg, limit, cursor
         )
         return JSONResponse(content=retrieved_data)
     except HTTPException as e:
@@ -620,6 +1135,64 @@ async def get_sensor_data(
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
+@app.post("/api/sensor/batch")
+async def add_sensor_data_batch(readings: List[dict] = Body(...)):
+    """
+    Add many sensor readings at once - can be called by device or authenticated user.
+
+    Each item is a SensorData reading plus its sensor_type. Valid readings are
+    written together in one transaction; the response reports a result per item.
+    """
+    if len(readings) > SENSOR_BATCH_MAX:
+        raise HTTPException(
+            status_code=413, detail=f"Batch too large. At most {SENSOR_BATCH_MAX} readings per request"
+        )
+
+    results = []
+    parsed = []
+    for index, item in enumerate(readings):
+        try:
+            parsed.append((index, SensorReading(**item)))
+            results.append({"index": index, "success": True})
+        except (ValidationError, TypeError) as e:
+            message = "; ".join(error["msg"] for error in e.errors()) if isinstance(e, ValidationError) else str(e)
+            results.append({"index": index, "success": False, "error": message})
+
+    # Check devices against the registry, and unknown ones with one query
+    device_ids = {reading.device_id for _, reading in parsed}
+    unknown = {device_id for device_id in device_ids if device_id not in device_registry}
+    registered = device_ids - unknown
+    if unknown:
+        try:
+            owners = await get_device_owners(unknown)
+        except DatabaseConnectionError as e:
+            raise HTTPException(status_code=503, detail=f"Database unavailable: {e}")
+        except mysql.Error as err:
+            raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        for device_id, user_id in owners:
+            device_registry.add(device_id, user_id)
+            registered.add(device_id)
+    rows = []
+    for index, reading in parsed:
+        if reading.device_id not in registered:
+            results[index] = {"index": index, "success": False, "error": "Device not registered in the system"}
+        else:
+            timestamp = reading.timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            rows.append((reading.sensor_type, reading.device_id, timestamp, reading.value, reading.unit))
+
+    try:
+        if rows:
+            await store_sensor_readings(rows)
+    except mysql.Error as err:
+        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+
+    return {
+        "success": len(rows) == len(readings),
+        "accepted": len(rows),
+        "rejected": len(readings) - len(rows),
+        "results": results,
+    }
+
 @app.post("/api/sensor/{sensor_type}")
 async def add_sensor_data(
     sensor_type: str,
@@ -627,34 +1200,35 @@ async def add_sensor_data(
     request: Request = None
 ):
     """Add new sensor data - can be called by device or authenticated user"""
-    valid_sensor_types = ["temperature", "light", "humidity"]
-    if sensor_type not in valid_sensor_types:
+    if sensor_type not in SENSOR_TYPES:
         raise HTTPException(status_code=404, detail="Sensor type not found")
 
-    # Check if device exists in our system
-    device = await get_devices_by_device_id(sensor_data.device_id)
-    if not device:
-        raise HTTPException(status_code=404, detail="Device not registered in the system")
-    
     # Set timestamp if not provided
     if sensor_data.timestamp is None:
         sensor_data.timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     try:
-        conn =  get_db_connection()
-        cursor = conn.cursor()
-        
-        query = f"INSERT INTO {sensor_type} (device_id, timestamp, value, unit) VALUES (%s, %s, %s, %s)"
-        values = (sensor_data.device_id, sensor_data.timestamp, sensor_data.value, sensor_data.unit)
-        
-        cursor.execute(query, values)
-        conn.commit()
-        new_id = cursor.lastrowid
-        
-        cursor.close()
-        conn.close()
+        # Check if device exists in our system
+        if not await is_registered_device(sensor_data.device_id):
+            raise HTTPException(status_code=404, detail="Device not registered in the system")
+
+        if ingest_buffer:
+            await store_sensor_readings([
+                (sensor_type, sensor_data.device_id, sensor_data.timestamp, sensor_data.value, sensor_data.unit)
+            ])
+            return {"success": True, "queued": ingest_buffer.ack == ACK_ON_ENQUEUE}
+
+        new_id = await insert_sensor_reading(
+            sensor_type, sensor_data.device_id, sensor_data.timestamp, sensor_data.value, sensor_data.unit
+        )
+        readings_accepted(
+            [(sensor_type, sensor_data.device_id, sensor_data.timestamp, sensor_data.value, sensor_data.unit)],
+            [new_id]
+        )
         
         return {"id": new_id, "success": True}
+    except DatabaseConnectionError as e:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {e}")
     except mysql.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
 
@@ -665,14 +1239,13 @@ async def get_latest_sensor_data(
     device_id: str = Query(None)
 ):
     """Get latest sensor reading for a device"""
+    if sensor_type not in SENSOR_TYPES:
+        raise HTTPException(status_code=404, detail="Sensor type not found")
+
     try:
         # Authenticate user
         user = await require_authenticated_user(request)
         
-        # Get user ID from session
-        user_details = await get_user_by_username(user["username"])
-        user_id = user_details["id"]
-        
         # If device_id is not specified, return an error
         if not device_id:
             return JSONResponse(
@@ -681,30 +1254,20 @@ async def get_latest_sensor_data(
             )
             
         # Verify user owns this device
-        devices = await get_devices_by_user_id(user_id)
-        if not any(device['device_id'] == device_id for device in devices):
+        if not owns_device(user, device_id):
             return JSONResponse(
                 content={"error": "Device not found or not authorized"}, 
                 status_code=403
             )
         
-        # Get latest reading
-        conn =  get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        query = f"SELECT * FROM {sensor_type} WHERE device_id = %s ORDER BY timestamp DESC LIMIT 1"
-        cursor.execute(query, (device_id,))
-        result = cursor.fetchone()
-        
-        cursor.close()
-        conn.close()
-        
-        if not result:
-            return JSONResponse(content={"error": "No data found for this device"}, status_code=404)
-        
-        # Convert datetime to string
-        if 'timestamp' in result and isinstance(result['timestamp'], datetime):
-            result['timestamp'] = result['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
+        # Answer from memory; only devices unknown to this worker hit the database
+        result = latest_readings.get(sensor_type, device_id)
+        if result is None:
+            result = await get_latest_sensor_reading(sensor_type, device_id)
+            if not result:
+                return JSONResponse(content={"error": "No data found for this device"}, status_code=404)
+            result = serialize_reading(result)
+            latest_readings.update(sensor_type, device_id, result)
             
         return JSONResponse(content=result)
     except HTTPException as e:
@@ -813,6 +1376,92 @@ async def get_light(request: Request, device_id: str = Query(None)):
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
+@app.get("/api/stats")
+async def get_stats(request: Request):
+    """Get server statistics (authenticated)"""
+    try:
+        await require_authenticated_user(request)
+        return JSONResponse(content={
+            "pool": get_pool_stats(),
+            "replica": get_replica_stats(),
+            "session_cache": session_cache.stats(),
+            "device_registry": device_registry.stats(),
+            "latest_readings": latest_readings.stats(),
+            "live": broadcaster.stats(),
+            "ingest": ingest_buffer.stats() if ingest_buffer else {"write_behind": False},
+        })
+    except HTTPException as e:
+        if e.status_code == 303:  # Redirect for authentication
+            return JSONResponse(content={"error": "Authentication required"}, status_code=401)
+        raise
+
+async def require_admin(request: Request) -> Dict:
+    """Ensure that the authenticated user is listed in ADMIN_USERS."""
+    user = await require_authenticated_user(request)
+    if user["username"] not in ADMIN_USERS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user
+
+async def run_import(job: Dict, request: ImportRequest):
+    """Run a CSV import on its own thread, recording progress in the job."""
+    job["status"] = "running"
+    try:
+        result = await asyncio.to_thread(
+            import_csv, job["path"], request.sensor_type, request.device_id, request.unit,
+            request.timestamp_format, progress=job["progress"].update
+        )
+        job["progress"].update(result)
+        if result.get("rollup_error"):
+            # The data is in; only the rollups of the imported days are stale
+            job["status"] = "completed_with_errors"
+            job["error"] = f"Rollups not rebuilt: {result['rollup_error']}"
+        else:
+            job["status"] = "completed"
+    except Exception as e:
+        print(f"Import of {job['path']} failed: {e}")
+        job["status"] = "failed"
+        job["error"] = str(e)
+
+@app.post("/api/admin/import", status_code=202)
+async def start_import(request: Request, body: ImportRequest):
+    """
+    Start importing a CSV file from IMPORT_DIR in the background (admin only).
+
+    Returns the job ID to poll with GET /api/admin/import/{job_id}. An
+    interrupted import resumes from its checkpoint when started again.
+    """
+    try:
+        await require_admin(request)
+        path = os.path.realpath(os.path.join(IMPORT_DIR, body.file))
+        if os.path.commonpath([path, IMPORT_DIR]) != IMPORT_DIR or not os.path.isfile(path):
+            return JSONResponse(content={"error": "File not found"}, status_code=404)
+        if any(job["path"] == path and job["status"] in ("queued", "running") for job in import_jobs.values()):
+            return JSONResponse(content={"error": "This file is already being imported"}, status_code=409)
+
+        job_id = str(uuid.uuid4())
+        job = {"id": job_id, "path": path, "status": "queued", "progress": {}, "error": None}
+        import_jobs[job_id] = job
+        job["task"] = asyncio.create_task(run_import(job, body))
+        return JSONResponse(content={"job_id": job_id}, status_code=202)
+    except HTTPException as e:
+        if e.status_code == 303:  # Redirect for authentication
+            return JSONResponse(content={"error": "Authentication required"}, status_code=401)
+        raise
+
+@app.get("/api/admin/import/{job_id}")
+async def get_import(job_id: str, request: Request):
+    """Get the status and progress of an import job (admin only)"""
+    try:
+        await require_admin(request)
+        job = import_jobs.get(job_id)
+        if job is None:
+            return JSONResponse(content={"error": "Import job not found"}, status_code=404)
+        return JSONResponse(content={key: value for key, value in job.items() if key != "task"})
+    except HTTPException as e:
+        if e.status_code == 303:  # Redirect for authentication
+            return JSONResponse(content={"error": "Authentication required"}, status_code=401)
+        raise
+
 @app.get("/user/sensors", response_class=HTMLResponse)
 async def sensors_dashboard(request: Request):
     """Show the sensors dashboard if authenticated"""
@@ -0,0 +1,321 @@
+"""
+Versioned schema migrations.
+
+This module owns the database schema. Each migration has a version, a
+description and an upgrade function that receives the connection and a cursor. Applied versions
+are recorded in the schema_migrations table, and every upgrade step is written
+to be idempotent so a partially applied migration can simply be re-run.
+
+Usage:
+    python -m app.migrations status
+    python -m app.migrations upgrade [--to VERSION]
+    python -m app.migrations benchmark
+"""
+import argparse
+import logging
+import time
+from typing import Dict, List, Optional
+
+from app.database import SENSOR_STORAGE, SENSOR_TYPES, get_db_connection, run_in_executor
+from app.partitions import ensure_readings_table
+from app.rollups import backfill, create_rollup_tables
+
+logger = logging.getLogger(__name__)
+
+# Named lock so that several workers starting at once apply migrations only once
+MIGRATION_LOCK = "schema_migrations"
+MIGRATION_LOCK_TIMEOUT = 60
+
+
+# Idempotency helpers
+def _column_exists(cursor, table: str, column: str) -> bool:
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.columns "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+        (table, column)
+    )
+    return cursor.fetchone()[0] > 0
+
+def _has_index_on(cursor, table: str, columns: List[str]) -> bool:
+    """Check whether any index of table starts with exactly these columns."""
+    cursor.execute(
+        "SELECT index_name, column_name FROM information_schema.statistics "
+        "WHERE table_schema = DATABASE() AND table_name = %s ORDER BY index_name, seq_in_index",
+        (table,)
+    )
+    indexes: Dict[str, list] = {}
+    for index_name, column_name in cursor.fetchall():
+        indexes.setdefault(index_name, []).append(column_name)
+    return any(index_columns[:len(columns)] == columns for index_columns in indexes.values())
+
+def _ensure_index(cursor, table: str, name: str, columns: List[str]):
+    if _has_index_on(cursor, table, columns):
+        logger.info(f"Index on {table}({', '.join(columns)}) already exists")
+        return
+    cursor.execute(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+    logger.info(f"Created index {name} on {table}({', '.join(columns)})")
+
+
+# Migrations
+def _001_baseline(connection, cursor):
+    """Users, sessions, devices, wardrobe and sensor tables."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            username VARCHAR(255) NOT NULL UNIQUE,
+            password VARCHAR(255) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sessions (
+            id VARCHAR(36) PRIMARY KEY,
+            user_id INT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS iot_devices (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            device_id VARCHAR(255) NOT NULL,
+            user_id INT NOT NULL,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS wardrobe_items (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            user_id INT NOT NULL,
+            item_name VARCHAR(255) NOT NULL,
+            category VARCHAR(100),
+            image_url VARCHAR(512),
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    """)
+    for sensor_type in SENSOR_TYPES:
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {sensor_type} (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                device_id VARCHAR(255) NOT NULL,
+                timestamp DATETIME NOT NULL,
+                value FLOAT NOT NULL,
+                unit VARCHAR(10) NOT NULL
+            )
+        """)
+        # Older databases created these tables without a device_id column
+        if not _column_exists(cursor, sensor_type, "device_id"):
+            cursor.execute(f"ALTER TABLE {sensor_type} ADD COLUMN device_id VARCHAR(255) NOT NULL DEFAULT '' AFTER id")
+
+def _002_indexes(connection, cursor):
+    """Time-series indexes on sensor tables and lookup indexes on devices and wardrobe items."""
+    for sensor_type in SENSOR_TYPES:
+        _ensure_index(cursor, sensor_type, f"idx_{sensor_type}_device_time", ["device_id", "timestamp"])
+        _ensure_index(cursor, sensor_type, f"idx_{sensor_type}_time", ["timestamp"])
+    _ensure_index(cursor, "iot_devices", "idx_iot_devices_device_id", ["device_id"])
+    _ensure_index(cursor, "iot_devices", "idx_iot_devices_user_id", ["user_id"])
+    _ensure_index(cursor, "wardrobe_items", "idx_wardrobe_items_user_id", ["user_id"])
+
+def _003_partitioned_readings(connection, cursor):
+    """Day-partitioned readings table, only when SENSOR_STORAGE=partitioned."""
+    # Switching to partitioned storage later creates the table at startup instead
+    if SENSOR_STORAGE == "partitioned":
+        ensure_readings_table(cursor)
+
+def _004_rollups(connection, cursor):
+    """Minute/hour/day rollup tables, built from the existing readings."""
+    create_rollup_tables(cursor)
+    # The backfill reads the configured readings source, which must exist by now
+    if SENSOR_STORAGE == "partitioned":
+        ensure_readings_table(cursor)
+    backfill(connection)
+
+MIGRATIONS = [
+    (1, "Baseline schema", _001_baseline),
+    (2, "Time-series and lookup indexes", _002_indexes),
+    (3, "Partitioned readings table", _003_partitioned_readings),
+    (4, "Sensor rollup tables", _004_rollups),
+]
+
+
+# Runner
+def _ensure_migrations_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def _applied_versions(cursor) -> Dict[int, Dict]:
+    cursor.execute("SELECT version, description, applied_at FROM schema_migrations ORDER BY version")
+    return {
+        version: {"description": description, "applied_at": applied_at}
+        for version, description, applied_at in cursor.fetchall()
+    }
+
+def migration_status() -> List[Dict]:
+    """Return every known migration with whether and when it was applied."""
+    connection = get_db_connection()
+    cursor = connection.cursor(buffered=True)
+    try:
+        _ensure_migrations_table(cursor)
+        applied = _applied_versions(cursor)
+        return [
+            {
+                "version": version,
+                "description": description,
+                "applied": version in applied,
+                "applied_at": applied[version]["applied_at"] if version in applied else None,
+            }
+            for version, description, _ in MIGRATIONS
+        ]
+    finally:
+        cursor.close()
+        connection.close()
+
+def migrate(target: Optional[int] = None) -> List[int]:
+    """
+    Apply pending migrations up to target (all of them by default).
+
+    Returns:
+        List[int]: Versions applied by this call
+    """
+    connection = get_db_connection()
+    cursor = connection.cursor(buffered=True)
+    applied_now = []
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (MIGRATION_LOCK, MIGRATION_LOCK_TIMEOUT))
+        if cursor.fetchone()[0] != 1:
+            raise RuntimeError("Timed out waiting for the schema migration lock")
+        try:
+            _ensure_migrations_table(cursor)
+            applied = _applied_versions(cursor)
+            for version, description, upgrade in MIGRATIONS:
+                if version in applied or (target is not None and version > target):
+                    continue
+                logger.info(f"Applying migration {version}: {description}")
+                # DDL commits implicitly in MySQL, so each step must be idempotent
+                upgrade(connection, cursor)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                    (version, description)
+                )
+                connection.commit()
+                applied_now.append(version)
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+            cursor.fetchall()
+        if applied_now:
+            logger.info(f"Applied migrations: {applied_now}")
+        else:
+            logger.info("Schema is up to date")
+        return applied_now
+    finally:
+        cursor.close()
+        connection.close()
+
+apply_migrations = run_in_executor(migrate)
+
+
+# Benchmark
+BENCHMARK_QUERIES = {
+    f"{sensor_type} {name}": query.format(table=sensor_type)
+    for sensor_type in SENSOR_TYPES
+    for name, query in {
+        "history": "SELECT * FROM {table} WHERE device_id = %(device_id)s AND timestamp >= %(start)s ORDER BY timestamp DESC",
+        "latest": "SELECT * FROM {table} WHERE device_id = %(device_id)s ORDER BY timestamp DESC LIMIT 1",
+    }.items()
+}
+BENCHMARK_QUERIES.update({
+    "devices by user": "SELECT * FROM iot_devices WHERE user_id = %(user_id)s ORDER BY added_at DESC",
+    "devices by device_id": "SELECT device_id, user_id FROM iot_devices WHERE device_id = %(device_id)s",
+    "wardrobe by user": "SELECT * FROM wardrobe_items WHERE user_id = %(user_id)s ORDER BY added_at DESC",
+})
+
+def explain_queries(params: Dict, repeat: int = 5) -> Dict[str, Dict]:
+    """Return the EXPLAIN plan and the best of `repeat` run times for each benchmark query."""
+    connection = get_db_connection()
+    cursor = connection.cursor(dictionary=True, buffered=True)
+    results = {}
+    try:
+        for name, query in BENCHMARK_QUERIES.items():
+            cursor.execute("EXPLAIN " + query, params)
+            plan = cursor.fetchall()
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                cursor.execute(query, params)
+                cursor.fetchall()
+                timings.append(time.perf_counter() - started)
+            results[name] = {
+                "type": ", ".join(str(row.get("type")) for row in plan),
+                "key": ", ".join(str(row.get("key")) for row in plan),
+                "rows": sum(int(row.get("rows") or 0) for row in plan),
+                "extra": "; ".join(str(row.get("Extra") or "") for row in plan),
+                "seconds": min(timings),
+            }
+        return results
+    finally:
+        cursor.close()
+        connection.close()
+
+def _benchmark_params() -> Dict:
+    connection = get_db_connection()
+    cursor = connection.cursor(buffered=True)
+    try:
+        cursor.execute("SELECT device_id, user_id FROM iot_devices LIMIT 1")
+        row = cursor.fetchone()
+        device_id, user_id = row if row else ("benchmark-device", 0)
+        return {"device_id": device_id, "user_id": user_id, "start": "1970-01-01 00:00:00"}
+    finally:
+        cursor.close()
+        connection.close()
+
+def _print_plans(title: str, plans: Dict[str, Dict]):
+    print(f"\n{title}")
+    print(f"{'query':<26} {'type':<8} {'key':<30} {'rows':>10} {'ms':>9}  extra")
+    for name, plan in plans.items():
+        print(f"{name:<26} {plan['type']:<8} {plan['key']:<30} {plan['rows']:>10} "
+              f"{plan['seconds'] * 1000:>9.2f}  {plan['extra']}")
+
+def benchmark():
+    """Show query plans and timings before and after applying pending migrations."""
+    params = _benchmark_params()
+    pending = [m["version"] for m in migration_status() if not m["applied"]]
+    before = explain_queries(params)
+    _print_plans(f"Before (pending migrations: {pending or 'none'})", before)
+    if not pending:
+        print("\nNo pending migrations. Run 'upgrade --to 1' on a fresh database to compare against the unindexed schema.")
+        return
+    migrate()
+    after = explain_queries(params)
+    _print_plans("After", after)
+    print("\nSpeedup")
+    for name in before:
+        speedup = before[name]["seconds"] / after[name]["seconds"] if after[name]["seconds"] else float("inf")
+        print(f"{name:<26} {speedup:>8.1f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the database schema")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("status", help="List applied and pending migrations")
+    upgrade = subcommands.add_parser("upgrade", help="Apply pending migrations")
+    upgrade.add_argument("--to", type=int, default=None, help="Stop after this version")
+    subcommands.add_parser("benchmark", help="Compare query plans before and after pending migrations")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        for m in migration_status():
+            state = f"applied {m['applied_at']}" if m["applied"] else "pending"
+            print(f"{m['version']:>4}  {m['description']:<40} {state}")
+    elif args.command == "upgrade":
+        print(f"Applied: {migrate(args.to) or 'nothing'}")
+    elif args.command == "benchmark":
+        benchmark()
+
+if __name__ == "__main__":
+    main()
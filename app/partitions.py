@@ -0,0 +1,231 @@
+"""
+Time-partitioned storage for raw sensor readings.
+
+With SENSOR_STORAGE=partitioned every sensor type is stored in one
+sensor_readings table, RANGE-partitioned by day on the reading timestamp.
+Partitions are named pYYYYMMDD after the day they hold, and a catch-all
+pfuture partition takes anything newer. The first daily partition also holds
+everything older than its day, so history beyond PARTITION_HISTORY_DAYS
+does not need a partition per day. A background task creates the
+partitions for the coming days in advance and enforces retention by
+dropping whole partitions, which is far cheaper than deleting rows. The
+rollup tables are not partitioned, so aggregated history outlives retention.
+
+Usage:
+    python -m app.partitions status
+    python -m app.partitions maintain [--days-ahead N] [--retention-days N]
+    python -m app.partitions copy-legacy [--sensor-type TYPE]
+"""
+import argparse
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, List
+
+from app.database import READINGS_TABLE, SENSOR_TYPES, get_db_connection, run_in_executor
+
+logger = logging.getLogger(__name__)
+
+PARTITION_DAYS_AHEAD = int(os.getenv("PARTITION_DAYS_AHEAD", "7"))
+# Days of raw readings to keep (0 keeps everything)
+SENSOR_RETENTION_DAYS = int(os.getenv("SENSOR_RETENTION_DAYS", "0"))
+PARTITION_CHECK_INTERVAL = float(os.getenv("PARTITION_CHECK_INTERVAL", "3600"))
+# Days of history that get their own partition when the table is created; older
+# readings share the first one (MySQL allows at most 8192 partitions per table)
+PARTITION_HISTORY_DAYS = int(os.getenv("PARTITION_HISTORY_DAYS", "366"))
+
+FUTURE_PARTITION = "pfuture"
+
+def partition_name(day: date) -> str:
+    return f"p{day:%Y%m%d}"
+
+def _partition_clause(day: date) -> str:
+    """Partition definition holding the readings of one day (and any earlier, for the first one)."""
+    return f"PARTITION {partition_name(day)} VALUES LESS THAN (TO_DAYS('{day + timedelta(days=1):%Y-%m-%d}'))"
+
+def create_readings_table(cursor, first_day: date, days_ahead: int = PARTITION_DAYS_AHEAD):
+    """Create the partitioned readings table with daily partitions from first_day to days_ahead days from now."""
+    last_day = date.today() + timedelta(days=days_ahead)
+    days = [first_day + timedelta(days=n) for n in range((last_day - first_day).days + 1)]
+    partitions = [_partition_clause(day) for day in days]
+    partitions.append(f"PARTITION {FUTURE_PARTITION} VALUES LESS THAN MAXVALUE")
+    # Unique keys must include the partitioning column, hence the (id, timestamp) primary key
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {READINGS_TABLE} (
+            id BIGINT AUTO_INCREMENT,
+            sensor_type VARCHAR(32) NOT NULL,
+            device_id VARCHAR(255) NOT NULL,
+            timestamp DATETIME NOT NULL,
+            value FLOAT NOT NULL,
+            unit VARCHAR(10) NOT NULL,
+            PRIMARY KEY (id, timestamp),
+            KEY idx_readings_type_device_time (sensor_type, device_id, timestamp),
+            KEY idx_readings_type_time (sensor_type, timestamp)
+        )
+        PARTITION BY RANGE (TO_DAYS(timestamp)) (
+            {", ".join(partitions)}
+        )
+    """)
+
+def _first_partition_day(cursor) -> date:
+    """Oldest legacy reading day, but no further back than retention and PARTITION_HISTORY_DAYS allow."""
+    first_days = []
+    for sensor_type in SENSOR_TYPES:
+        cursor.execute(f"SELECT DATE(MIN(timestamp)) FROM {sensor_type}")
+        first_day = cursor.fetchone()[0]
+        if first_day is not None:
+            first_days.append(first_day)
+    history = min(SENSOR_RETENTION_DAYS, PARTITION_HISTORY_DAYS) if SENSOR_RETENTION_DAYS > 0 else PARTITION_HISTORY_DAYS
+    today = date.today()
+    return max(min(first_days, default=today), today - timedelta(days=history))
+
+def ensure_readings_table(cursor) -> bool:
+    """Create the partitioned readings table if it does not exist yet; return whether it was created."""
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s",
+        (READINGS_TABLE,)
+    )
+    if cursor.fetchone()[0]:
+        return False
+    # Start at the oldest legacy reading so copied history is spread over days
+    create_readings_table(cursor, _first_partition_day(cursor))
+    return True
+
+def list_partitions(cursor) -> List[Dict]:
+    """Return the readings table's partitions, oldest first, with their day and approximate row count."""
+    cursor.execute(
+        "SELECT partition_name, table_rows FROM information_schema.partitions "
+        "WHERE table_schema = DATABASE() AND table_name = %s ORDER BY partition_ordinal_position",
+        (READINGS_TABLE,)
+    )
+    partitions = []
+    for name, rows in cursor.fetchall():
+        day = None if name == FUTURE_PARTITION else datetime.strptime(name[1:], "%Y%m%d").date()
+        partitions.append({"name": name, "day": day, "rows": rows})
+    return partitions
+
+def ensure_partitions(cursor, days_ahead: int = PARTITION_DAYS_AHEAD) -> List[str]:
+    """Split daily partitions off pfuture up to days_ahead days from now and return their names."""
+    days = [p["day"] for p in list_partitions(cursor) if p["day"]]
+    if not days:
+        return []
+    last_day = date.today() + timedelta(days=days_ahead)
+    new_days = [days[-1] + timedelta(days=n) for n in range(1, (last_day - days[-1]).days + 1)]
+    if not new_days:
+        return []
+    partitions = [_partition_clause(day) for day in new_days]
+    partitions.append(f"PARTITION {FUTURE_PARTITION} VALUES LESS THAN MAXVALUE")
+    # pfuture is normally empty, so reorganizing it does not copy any rows
+    cursor.execute(
+        f"ALTER TABLE {READINGS_TABLE} REORGANIZE PARTITION {FUTURE_PARTITION} INTO ({', '.join(partitions)})"
+    )
+    return [partition_name(day) for day in new_days]
+
+def drop_expired_partitions(cursor, retention_days: int = SENSOR_RETENTION_DAYS) -> List[str]:
+    """Drop the daily partitions older than retention_days and return their names."""
+    if retention_days <= 0:
+        return []
+    cutoff = date.today() - timedelta(days=retention_days)
+    days = [p["day"] for p in list_partitions(cursor) if p["day"]]
+    # A table needs at least one partition, so the newest daily partition always stays
+    expired = [partition_name(day) for day in days[:-1] if day < cutoff]
+    if expired:
+        cursor.execute(f"ALTER TABLE {READINGS_TABLE} DROP PARTITION {', '.join(expired)}")
+    return expired
+
+def maintain_partitions(days_ahead: int = PARTITION_DAYS_AHEAD,
+                        retention_days: int = SENSOR_RETENTION_DAYS) -> Dict[str, List[str]]:
+    """Create the readings table if needed, then create upcoming partitions and drop expired ones."""
+    connection = get_db_connection()
+    cursor = connection.cursor(buffered=True)
+    try:
+        if ensure_readings_table(cursor):
+            logger.info(f"Created the partitioned {READINGS_TABLE} table")
+        created = ensure_partitions(cursor, days_ahead)
+        dropped = drop_expired_partitions(cursor, retention_days)
+        if created:
+            logger.info(f"Created partitions {created[0]}..{created[-1]}")
+        if dropped:
+            logger.info(f"Dropped expired partitions {dropped[0]}..{dropped[-1]}")
+        return {"created": created, "dropped": dropped}
+    finally:
+        cursor.close()
+        connection.close()
+
+maintain_partitions_async = run_in_executor(maintain_partitions)
+
+def copy_legacy_readings(connection, sensor_types=SENSOR_TYPES) -> int:
+    """
+    Copy readings from the per-type tables into the partitioned table, one day per transaction.
+
+    Each day is replaced rather than appended, so an interrupted copy can be re-run.
+
+    Returns:
+        int: Number of rows copied
+    """
+    cursor = connection.cursor(buffered=True)
+    copied = 0
+    try:
+        for sensor_type in sensor_types:
+            cursor.execute(f"SELECT MIN(timestamp), MAX(timestamp) FROM {sensor_type}")
+            first, last = cursor.fetchone()
+            if first is None:
+                continue
+            day = datetime.combine(first.date(), datetime.min.time())
+            while day <= last:
+                next_day = day + timedelta(days=1)
+                cursor.execute(
+                    f"DELETE FROM {READINGS_TABLE} WHERE sensor_type = %s AND timestamp >= %s AND timestamp < %s",
+                    (sensor_type, day, next_day)
+                )
+                cursor.execute(f"""
+                    INSERT INTO {READINGS_TABLE} (sensor_type, device_id, timestamp, value, unit)
+                    SELECT %s, device_id, timestamp, value, unit FROM {sensor_type}
+                    WHERE timestamp >= %s AND timestamp < %s
+                """, (sensor_type, day, next_day))
+                copied += cursor.rowcount
+                connection.commit()
+                day = next_day
+            logger.info(f"Copied {sensor_type} readings up to {last}")
+        return copied
+    finally:
+        cursor.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the partitioned readings table")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("status", help="List partitions and their row counts")
+    maintain = subcommands.add_parser("maintain", help="Create upcoming partitions and drop expired ones")
+    maintain.add_argument("--days-ahead", type=int, default=PARTITION_DAYS_AHEAD)
+    maintain.add_argument("--retention-days", type=int, default=SENSOR_RETENTION_DAYS)
+    copy = subcommands.add_parser("copy-legacy", help="Copy readings from the per-type tables")
+    copy.add_argument("--sensor-type", choices=SENSOR_TYPES, default=None)
+    args = parser.parse_args()
+
+    if args.command == "maintain":
+        result = maintain_partitions(args.days_ahead, args.retention_days)
+        print(f"Created {len(result['created'])} partition(s), dropped {len(result['dropped'])}")
+        return
+
+    connection = get_db_connection()
+    try:
+        if args.command == "status":
+            cursor = connection.cursor(buffered=True)
+            try:
+                for partition in list_partitions(cursor):
+                    print(f"{partition['name']:<12} {partition['rows']:>12}")
+            finally:
+                cursor.close()
+        elif args.command == "copy-legacy":
+            cursor = connection.cursor(buffered=True)
+            try:
+                ensure_readings_table(cursor)
+            finally:
+                cursor.close()
+            sensor_types = [args.sensor_type] if args.sensor_type else SENSOR_TYPES
+            print(f"Copied {copy_legacy_readings(connection, sensor_types)} reading(s)")
+    finally:
+        connection.close()
+
+if __name__ == "__main__":
+    main()
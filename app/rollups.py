@@ -0,0 +1,109 @@
+"""
+Rollup tables for sensor readings.
+
+Every sensor type has minute, hour and day rollups holding the count, sum,
+min and max of its readings per device and bucket. Ingest keeps them up to
+date incrementally; this module rebuilds them from existing data.
+
+Usage:
+    python -m app.rollups backfill [--sensor-type TYPE] [--start-date DATE] [--end-date DATE]
+"""
+import argparse
+import logging
+from datetime import datetime, timedelta
+
+from app.database import (ROLLUP_RESOLUTIONS, SENSOR_TYPES, bucket_start, get_db_connection, rollup_table,
+                          sensor_source)
+
+logger = logging.getLogger(__name__)
+
+def create_rollup_tables(cursor):
+    """Create the rollup tables for every sensor type and resolution."""
+    for sensor_type in SENSOR_TYPES:
+        for resolution in ROLLUP_RESOLUTIONS:
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {rollup_table(sensor_type, resolution)} (
+                    device_id VARCHAR(255) NOT NULL,
+                    bucket_start DATETIME NOT NULL,
+                    reading_count INT NOT NULL,
+                    value_sum DOUBLE NOT NULL,
+                    value_min FLOAT NOT NULL,
+                    value_max FLOAT NOT NULL,
+                    PRIMARY KEY (device_id, bucket_start),
+                    KEY idx_bucket_start (bucket_start)
+                )
+            """)
+
+def _rebuild_day(cursor, sensor_type: str, day: datetime):
+    """Recompute every rollup bucket of one day from the raw readings."""
+    next_day = day + timedelta(days=1)
+    source, where_clauses, parameters = sensor_source(sensor_type)
+    where = " ".join(f"AND {clause}" for clause in where_clauses)
+    for resolution, seconds in ROLLUP_RESOLUTIONS.items():
+        table = rollup_table(sensor_type, resolution)
+        cursor.execute(f"DELETE FROM {table} WHERE bucket_start >= %s AND bucket_start < %s", (day, next_day))
+        cursor.execute(f"""
+            INSERT INTO {table} (device_id, bucket_start, reading_count, value_sum, value_min, value_max)
+            SELECT device_id,
+                   DATE_ADD('1970-01-01', INTERVAL (TIMESTAMPDIFF(SECOND, '1970-01-01', timestamp) DIV %s) * %s SECOND) AS bucket,
+                   COUNT(*), SUM(value), MIN(value), MAX(value)
+            FROM {source}
+            WHERE timestamp >= %s AND timestamp < %s {where}
+            GROUP BY device_id, bucket
+        """, (seconds, seconds, day, next_day, *parameters))
+
+def backfill(connection, sensor_types=SENSOR_TYPES, start_date: datetime = None, end_date: datetime = None) -> int:
+    """
+    Rebuild the rollups from raw readings in [start_date, end_date), one day per transaction.
+
+    Readings ingested for a day while it is being rebuilt may be counted
+    twice or not at all, so run it while ingest is quiet.
+
+    Returns:
+        int: Number of days rebuilt
+    """
+    cursor = connection.cursor(buffered=True)
+    days = 0
+    try:
+        for sensor_type in sensor_types:
+            table, where_clauses, parameters = sensor_source(sensor_type)
+            where = f" WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+            cursor.execute(f"SELECT MIN(timestamp), MAX(timestamp) FROM {table}{where}", tuple(parameters))
+            first, last = cursor.fetchone()
+            if first is None:
+                continue
+            day = bucket_start(max(first, start_date) if start_date else first, 86400)
+            if end_date:
+                last = min(last, end_date - timedelta(seconds=1))
+            while day <= last:
+                _rebuild_day(cursor, sensor_type, day)
+                connection.commit()
+                days += 1
+                day += timedelta(days=1)
+            logger.info(f"Rebuilt {sensor_type} rollups up to {last}")
+        return days
+    finally:
+        cursor.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage sensor rollup tables")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    rebuild = subcommands.add_parser("backfill", help="Rebuild rollups from raw readings")
+    rebuild.add_argument("--sensor-type", choices=SENSOR_TYPES, default=None)
+    rebuild.add_argument("--start-date", default=None, help="YYYY-MM-DD")
+    rebuild.add_argument("--end-date", default=None, help="YYYY-MM-DD")
+    args = parser.parse_args()
+
+    start_date = datetime.strptime(args.start_date, "%Y-%m-%d") if args.start_date else None
+    end_date = datetime.strptime(args.end_date, "%Y-%m-%d") + timedelta(days=1) if args.end_date else None
+    sensor_types = [args.sensor_type] if args.sensor_type else SENSOR_TYPES
+
+    connection = get_db_connection()
+    try:
+        days = backfill(connection, sensor_types, start_date, end_date)
+        print(f"Rebuilt {days} day(s) of rollups")
+    finally:
+        connection.close()
+
+if __name__ == "__main__":
+    main()
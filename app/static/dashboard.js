@@ -55,6 +55,38 @@ async function fetchData(sensorType) {
     }
 }
 
+// Device shown on each sensor's chart, so live updates only append its readings
+let chartedDevices = {};
+
+// Fetch every sensor's readings in one call and return them keyed by sensor type
+async function fetchSeries(dataRange) {
+    try {
+        const response = await fetch(`/api/sensor/series?limit=${dataRange}`);
+        if (!response.ok) {
+            throw new Error(`HTTP error! Status: ${response.status}`);
+        }
+
+        const payload = await response.json();
+        const bySensor = {};
+        chartedDevices = {};
+        payload.series.forEach(series => {
+            // Chart the first device that has readings for each sensor type
+            if (bySensor[series.sensor_type] || series.timestamps.length === 0) {
+                return;
+            }
+            chartedDevices[series.sensor_type] = series.device_id;
+            bySensor[series.sensor_type] = series.timestamps.map((timestamp, i) => ({
+                timestamp: timestamp,
+                value: series.values[i]
+            }));
+        });
+        return bySensor;
+    } catch (error) {
+        console.error('Error fetching sensor series:', error);
+        return {};
+    }
+}
+
 // Inspect and fix timestamp format if needed
 function ensureCorrectTimestampFormat(dataPoint) {
     // Check what format the timestamp is in
@@ -93,8 +125,10 @@ function ensureCorrectTimestampFormat(dataPoint) {
 }
 
 // Render chart with properly formatted date/time
-async function renderChart(sensorType, chartId, label, color, dataRange = currentDataRange) {
-    const data = await fetchData(sensorType);
+async function renderChart(sensorType, chartId, label, color, dataRange = currentDataRange, data = null) {
+    if (!data) {
+        data = await fetchData(sensorType);
+    }
     if (!data || data.length === 0) {
         console.error(`No data received for ${sensorType}`);
         document.getElementById(chartId).innerHTML = `No ${sensorType} data available`;
@@ -183,10 +217,11 @@ async function renderChart(sensorType, chartId, label, color, dataRange = curren
 }
 
 // Function to refresh all charts with the current data range
-function refreshAllCharts() {
-    renderChart('temperature', 'temperature_Chart', 'Temperature (°C)', 'rgba(255, 99, 132, 1)', currentDataRange);
-    renderChart('humidity', 'humidity_Chart', 'Humidity (%)', 'rgba(54, 162, 235, 1)', currentDataRange);
-    renderChart('light', 'light_Chart', 'Light Level (lux)', 'rgba(255, 206, 86, 1)', currentDataRange);
+async function refreshAllCharts() {
+    const series = await fetchSeries(currentDataRange);
+    renderChart('temperature', 'temperature_Chart', 'Temperature (°C)', 'rgba(255, 99, 132, 1)', currentDataRange, series.temperature);
+    renderChart('humidity', 'humidity_Chart', 'Humidity (%)', 'rgba(54, 162, 235, 1)', currentDataRange, series.humidity);
+    renderChart('light', 'light_Chart', 'Light Level (lux)', 'rgba(255, 206, 86, 1)', currentDataRange, series.light);
 }
 
 // Update the getLatestSensorData function to always include the device_id parameter
@@ -434,18 +469,75 @@ let autoUpdateEnabled = false;
 let updateInterval = 30000; // Default to 30 seconds
 let updateIntervalId = null;
 
+// Live updates pushed by the server (Server-Sent Events)
+let liveSource = null;
+const chartIds = {
+    temperature: 'temperature_Chart',
+    humidity: 'humidity_Chart',
+    light: 'light_Chart'
+};
+
+// Append a pushed reading to its chart, keeping the last N data points
+function appendReading(reading) {
+    // Charts show one device each; a sensor without history adopts the first device that reports
+    const chartedDevice = chartedDevices[reading.sensor_type];
+    if (chartedDevice === undefined) {
+        chartedDevices[reading.sensor_type] = reading.device_id;
+    } else if (chartedDevice !== reading.device_id) {
+        return;
+    }
+
+    const canvas = document.getElementById(chartIds[reading.sensor_type]);
+    const chart = canvas ? Chart.getChart(canvas) : null;
+    if (!chart) return;
+
+    chart.data.labels.push(formatDateTime(ensureCorrectTimestampFormat(reading)));
+    chart.data.datasets[0].data.push(reading.value);
+    while (chart.data.labels.length > currentDataRange) {
+        chart.data.labels.shift();
+        chart.data.datasets[0].data.shift();
+    }
+    chart.update();
+
+    const lastUpdate = document.getElementById('last-update-time');
+    if (lastUpdate) {
+        lastUpdate.textContent = 'Last updated: ' + new Date().toLocaleString();
+    }
+}
+
+// Subscribe to new readings of the user's devices; returns false if unsupported
+function startLiveUpdates() {
+    if (!window.EventSource) return false;
+    liveSource = new EventSource('/api/sensor/stream');
+    liveSource.addEventListener('reading', event => appendReading(JSON.parse(event.data)));
+    liveSource.onerror = () => console.warn('Live update stream interrupted, reconnecting...');
+    return true;
+}
+
+function stopLiveUpdates() {
+    if (liveSource) {
+        liveSource.close();
+        liveSource = null;
+    }
+}
+
 // Function to toggle auto-updates
 function toggleAutoUpdate() {
     autoUpdateEnabled = !autoUpdateEnabled;
     const toggleButton = document.getElementById('auto-update-toggle');
     
     if (autoUpdateEnabled) {
-        // Start the auto-update interval
-        updateIntervalId = setInterval(refreshAllCharts, updateInterval);
+        // Prefer server push; poll on the interval only if it is unavailable
+        if (startLiveUpdates()) {
+            console.log('Auto-update enabled with live server updates');
+        } else {
+            updateIntervalId = setInterval(refreshAllCharts, updateInterval);
+            console.log(`Auto-update enabled with ${updateInterval/1000}s interval`);
+        }
         toggleButton.textContent = 'Disable Auto-Update';
         toggleButton.classList.add('active');
-        console.log(`Auto-update enabled with ${updateInterval/1000}s interval`);
     } else {
+        stopLiveUpdates();
         // Clear the interval
         if (updateIntervalId) {
             clearInterval(updateIntervalId);
@@ -470,8 +562,8 @@ function changeUpdateFrequency(seconds) {
         }
     });
     
-    // Restart interval if auto-update is enabled
-    if (autoUpdateEnabled) {
+    // Restart interval if auto-update is enabled and polling
+    if (autoUpdateEnabled && !liveSource) {
         if (updateIntervalId) {
             clearInterval(updateIntervalId);
         }
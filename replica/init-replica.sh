@@ -0,0 +1,22 @@
+#!/bin/bash
+# Runs once when the replica's data directory is initialised. The replica
+# creates the same database and user as the primary by itself, so it starts
+# replicating from the primary's current GTID position instead of replaying
+# the primary's own initialisation.
+set -euo pipefail
+
+source_gtids=$(mysql -h db -uroot -p"$MYSQL_ROOT_PASSWORD" -N -e "SELECT @@GLOBAL.gtid_executed")
+
+mysql -uroot -p"$MYSQL_ROOT_PASSWORD" <<SQL
+-- The app checks replication lag with SHOW REPLICA STATUS
+GRANT REPLICATION CLIENT ON *.* TO '${MYSQL_USER}'@'%';
+RESET BINARY LOGS AND GTIDS;
+SET GLOBAL gtid_purged = '${source_gtids}';
+CHANGE REPLICATION SOURCE TO
+    SOURCE_HOST = 'db',
+    SOURCE_USER = 'root',
+    SOURCE_PASSWORD = '${MYSQL_ROOT_PASSWORD}',
+    SOURCE_AUTO_POSITION = 1,
+    GET_SOURCE_PUBLIC_KEY = 1;
+START REPLICA;
+SQL